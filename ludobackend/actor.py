@@ -5,9 +5,9 @@ import traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from signal import signal, SIGINT, SIGTERM
 import rpyc
-from ludo import Ludo, GameConfig, LudoModel
+from ludo import Ludo, GameConfig, LudoModel, ROLL_IDS
 import json
-from mcts import MCTNode, mcts_job, softmax
+from mcts import MCTNode, mcts_job, batched_search, softmax, RootParallelSearch, NodePool, merge_root_stats
 import numpy as np
 import random
 from copy import deepcopy
@@ -24,21 +24,25 @@ C_PUCT = 5
 NUM_SIMULATIONS = 100
 SELECTION_TEMP = 0.001
 PRIOR_TEMP = 0.5
+# Single-threaded search which evaluates the leaves of LEAF_BATCH_SIZE simulations at once (see mcts.batched_search) instead of the thread pool
+BATCHED_SEARCH = False
+LEAF_BATCH_SIZE = 16
+# Number of processes which search independent trees of the root in parallel and merge their root statistics (see mcts.RootParallelSearch), 0 to search
+# a single tree in this process
+ROOT_PARALLEL_WORKERS = 0
+# Search every move in a NodePool (struct-of-arrays tree, see mcts.NodePool) instead of the tree of MCTNode objects
+NODE_POOL = False
 
 
 def prune(node, roll):
-    # Pruning all moves inconsistent with node
-    from_index, to_index = 0, len(node.available_moves)
-    found = False
-    for index, move_dict in enumerate(node.available_moves):
-        if move_dict["roll"] == roll and not found:
-            from_index = index
-            found = True
-        elif move_dict["roll"] != roll and found:
-            to_index = index
-            found = False
-            break
-    node.prune(from_index, to_index)
+    # Pruning all moves inconsistent with the roll. The moves of the roll are generated first if the roll has not been sampled at the node yet, their
+    # priors are then set by the first simulation which reaches the node (see MCTNode.roll_evaluated()).
+    roll_id = ROLL_IDS[tuple(roll)]
+    if not node.expanded:
+        node.expand()
+    if not node.roll_expanded(roll_id):
+        node.expand_roll(roll_id)
+    node.prune(roll_id)
 
 
 def move_probabilities(a, temp=0.1):
@@ -53,8 +57,9 @@ class PlayerAgent:
         self.player_index = player_index
         self.player = player
         self.game_engine = game_engine
+        self.node_pool = None
 
-    def get_next_move(self, root, evaluator_conn, threadpool, roll):
+    def get_next_move(self, root, evaluator_conn, threadpool, roll, searcher=None):
         """This function executes MCTS simulations and choses a move based on that"""
         # if len(available_moves) > 0:
         #     return random.choice(available_moves)
@@ -65,18 +70,37 @@ class PlayerAgent:
         futures = []
         max_depth = []
         print(f"Sims: {len(root.available_moves) + 25}")
-        for i in range(len(root.available_moves) + 25):
-            futures.append(threadpool.submit(mcts_job, i, root, self.player, evaluator_conn, C_PUCT, N_VL, PRIOR_TEMP))
-        max_depth = [future.result() for future in as_completed(futures)]
+        if searcher is not None:
+            prune(root, roll)
+            moves, n, w, max_depth = searcher.search(root.state, roll, self.game_engine.model.config.player_colour, self.player_index, evaluator_conn,
+                                                     len(root.available_moves) + 25)
+            # The merged statistics are matched to the moves of the root by move, the workers may generate the moves in another order
+            searcher.merge(root, roll, self.player, moves, n, w)
+        elif NODE_POOL:
+            # The pool is searched from the root for every move, its root statistics are matched to the moves of the root by move
+            prune(root, roll)
+            if self.node_pool is None:
+                self.node_pool = NodePool(self.game_engine.model, self.player)
+            self.node_pool.reset(root.state, roll)
+            max_depth = [self.node_pool.simulate(evaluator_conn, C_PUCT, N_VL, PRIOR_TEMP) for _ in range(len(root.available_moves) + 25)]
+            moves, n, w = self.node_pool.root_moves()
+            merge_root_stats(root, ROLL_IDS[tuple(roll)], self.player, moves, n, w)
+        elif BATCHED_SEARCH:
+            max_depth = batched_search(root, self.player, evaluator_conn, len(root.available_moves) + 25, LEAF_BATCH_SIZE, C_PUCT, N_VL, PRIOR_TEMP)
+        else:
+            for i in range(len(root.available_moves) + 25):
+                futures.append(threadpool.submit(mcts_job, i, root, self.player, evaluator_conn, C_PUCT, N_VL, PRIOR_TEMP))
+            max_depth = [future.result() for future in as_completed(futures)]
         end = time.perf_counter()
         print(f"Overall time: {end - start}")
         
         # Prune just to be safe
         prune(root, roll)
 
-        # Select a move
-        p = move_probabilities(root.stats[self.player.name]["N"], temp=SELECTION_TEMP)
-        chosen_move_index = np.random.choice(np.arange(len(root.available_moves)), p=p)
+        # Select a move among the moves of the roll
+        from_index, to_index = root.segments[ROLL_IDS[tuple(roll)]]
+        p = move_probabilities(root.stats[self.player.name]["N"][from_index: to_index], temp=SELECTION_TEMP)
+        chosen_move_index = from_index + np.random.choice(np.arange(to_index - from_index), p=p)
         chosen_move = root.available_moves[chosen_move_index]["move"]
         print(f"Player: {self.player_index} N:{root.stats[self.player.name]['N']} W:{root.stats[self.player.name]['W']} P:{p}")
 
@@ -84,10 +108,10 @@ class PlayerAgent:
 
     def update_tree(self, root, roll, move_index):
         # Take the move on the tree and free the rest of the tree that is not required
-        root = root.children[move_index]
+        root = root.get_child(move_index)
         root.parent = None
         # Prune all moves which are inconsistent with current roll
-        if root.expanded:
+        if not root.state["game_over"]:
             print("Pruning in update tree")
             prune(root, roll)
         gc.collect()
@@ -100,6 +124,7 @@ class Actor:
         self.train_server_conn = None
         self.eval_server_conn = None
         self.evaluator_process = None
+        self.searcher = None
 
     def initialize_game(self):
         # Removing bias by randomizing the color of the players
@@ -107,7 +132,8 @@ class Actor:
         random.shuffle(colours)
         game_config = GameConfig(colours)
 
-        game_engine = Ludo(game_config)
+        # Search trees keep thousands of states alive, persistent states share the unchanged positions of a state with its children
+        game_engine = Ludo(game_config, persistent=True)
 
         return game_config, game_engine
 
@@ -115,7 +141,7 @@ class Actor:
         # Initialize data stores for logging and other game-related data
         data_store = {
             "player_won": None,  # Initialize as None until a player wins
-            "states": [],  # List of game state tensors
+            "states": [],  # List of game states
         }
 
         log = {
@@ -134,8 +160,7 @@ class Actor:
 
         # Creating root
         root = MCTNode(deepcopy(game_engine.state), game_config.players, game_engine.model, None)
-        # Expanding root
-        root.expand()
+        # Expanding root with the moves of its roll
         prune(root, game_engine.state["dice_roll"])
 
         # Playing the game
@@ -143,12 +168,13 @@ class Actor:
             # Selecting the currently active player
             current_agent = player_agents[game_engine.state["current_player"]]
 
-            game_data = {"game_state": game_engine.model.get_state_jsonable(game_engine.state)}
-            data_store["states"].append(game_engine.model.state_to_repr(game_engine.state).tolist())
+            game_data = {"current_player": game_engine.state["current_player"]}
+            data_store["states"].append(game_engine.state)
 
             # Selecting a move using MCTS
             print(f"Selecting move for player: {current_agent.player.name}")
-            best_move, best_move_index, max_depth = current_agent.get_next_move(root, self.eval_server_conn, self.executor, game_engine.state["dice_roll"])
+            best_move, best_move_index, max_depth = current_agent.get_next_move(root, self.eval_server_conn, self.executor, game_engine.state["dice_roll"],
+                                                                                 self.searcher)
             
             print(f"Max depth: {max_depth}")
             
@@ -167,20 +193,21 @@ class Actor:
             # TODO: Add all moves and their selection probabilities in game_data
             log["game"].append(game_data)
 
-        game_data = {"game_state": game_engine.model.get_state_jsonable(game_engine.state), "move_id": len(log["game"]), "move": []}
-        log["game"].append(game_data)
-        data_store["states"].append(game_engine.model.state_to_repr(game_engine.state).tolist())
+        data_store["states"].append(game_engine.state)
         end_time = time.perf_counter()
 
         print(f"Game Generation Time: {end_time - start_time}")
 
         print("Game Moves:")
         for move_data in log["game"]:
-            print(f"Player: {move_data['game_state']['current_player']}, Move id: {move_data['move_id']}, Move: {move_data['move']}")
+            print(f"Player: {move_data['current_player']}, Move id: {move_data['move_id']}, Move: {move_data['move']}")
 
         data_store["player_won"] = game_config.players.index(game_engine.winner) + 1
         log["config"] = game_config.get_dict()
         log["player_won"] = data_store["player_won"]
+        # The whole game is sent as a single binary record (see LudoCodec)
+        data_store["game"] = game_engine.model.codec.encode_game(data_store["states"], [game_data["move"] for game_data in log["game"]],
+                                                                 data_store["player_won"] - 1)
 
     def send_data_to_train_server(self, data_store, log):
         try:
@@ -188,7 +215,7 @@ class Actor:
             if self.train_server_conn is None:
                 print("Error: Training server connection is not established.")
                 return
-            self.train_server_conn.root.push_game_data(json.dumps(data_store), json.dumps(log))
+            self.train_server_conn.root.push_game_data(data_store["game"])
 
         except Exception as e:
             print(f"Error while sending data to the training server: {str(e)}")
@@ -212,6 +239,8 @@ class Actor:
                 connected = False
             time.sleep(0.1)
         self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        if ROOT_PARALLEL_WORKERS > 0:
+            self.searcher = RootParallelSearch(ROOT_PARALLEL_WORKERS, LEAF_BATCH_SIZE, C_PUCT, N_VL, PRIOR_TEMP)
 
         game = 0
         while game < NUM_GAMES:
@@ -228,10 +257,14 @@ class Actor:
             game += 1
 
         self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.searcher:
+            self.searcher.close()
 
     def close(self, signal, frame):
         if self.executor:
             self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.searcher:
+            self.searcher.close()
         if self.train_server_conn:
             self.train_server_conn.close()
         if self.eval_server_conn:
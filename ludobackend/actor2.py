@@ -40,20 +40,19 @@ class PlayerAgent:
         """This function executes MCTS simulations and choses a move based on that"""
 
         start = time.perf_counter()
-        available_moves = []
-        for m in self.game_engine.model.all_possible_moves(state):
-            if m["roll"] == state["dice_roll"]:
-                available_moves = m["moves"]
+        # Moves with symmetric next states are evaluated once, a representative move stands for multiplicities[i] moves
+        available_moves, multiplicities = self.game_engine.model.distinct_moves(state, state["dice_roll"])
         if len(available_moves) > 0:
             next_states = []
             for move in available_moves:
                 next_states.append(self.game_engine.model.generate_next_state(state, move))
-            for state in next_states:
-                state["current_player"] = self.player_index
-            next_states = tf.stack([self.game_engine.model.state_to_repr(state) for state in next_states])
+            next_states = self.game_engine.model.states_to_repr_batch(next_states)
+            next_states[:, :, 20] = self.player_index + 1
+            next_states = tf.convert_to_tensor(next_states)
 
             results = self.nnet(next_states, training=False)[:, 0]
-            p = softmax(results, temp=SELECTION_TEMP)
+            p = softmax(results, temp=SELECTION_TEMP) * multiplicities
+            p = p / np.sum(p)
             chosen_move = random.choices(available_moves, p)[0]
 
             # Getting the top 10 moves and their probabilities for logging
@@ -92,12 +91,12 @@ class Actor:
         # Initialize data stores for logging and other game-related data
         data_store = {
             "player_won": None,  # Initialize as None until a player wins
-            "states": [],  # List of game state tensors
+            "states": [],  # List of game states
         }
 
         log = {
             "config": None,  # Game configuration dictionary
-            "game": [],  # List of dictionaries for each game
+            "game": [],  # List of dictionaries of the move taken from every state
             "player_won": None  # Initialize as None until a player wins
         }
 
@@ -143,8 +142,8 @@ class Actor:
             # Selecting the currently active player
             self.current_agent = player_agents[game_engine.state["current_player"]]
 
-            game_data = {"game_state": game_engine.model.get_state_jsonable(game_engine.state)}
-            data_store["states"].append(game_engine.model.state_to_repr(game_engine.state).tolist())
+            game_data = {}
+            data_store["states"].append(game_engine.state)
 
             # Selecting move
             # print(f"Selecting move for player: {self.current_agent.player.name}")
@@ -162,10 +161,7 @@ class Actor:
             game_data["top_moves"] = top_moves
             log["game"].append(game_data)
 
-        game_data = {"game_state": game_engine.model.get_state_jsonable(game_engine.state), "move_id": len(log["game"]),
-                     "move": []}
-        log["game"].append(game_data)
-        data_store["states"].append(game_engine.model.state_to_repr(game_engine.state).tolist())
+        data_store["states"].append(game_engine.state)
         end_time = time.perf_counter()
         print("")
 
@@ -179,6 +175,9 @@ class Actor:
         data_store["player_won"] = game_config.players.index(game_engine.winner) + 1
         log["config"] = game_config.get_dict()
         log["player_won"] = data_store["player_won"]
+        # The whole game is sent as a single binary record (see LudoCodec)
+        data_store["game"] = game_engine.model.codec.encode_game(data_store["states"], [game_data["move"] for game_data in log["game"]],
+                                                                 data_store["player_won"] - 1, [game_data["top_moves"] for game_data in log["game"]])
 
     def send_data_to_train_server(self, data_store, log):
         start = time.perf_counter()
@@ -187,7 +186,7 @@ class Actor:
             if self.train_server_conn is None:
                 print("Error: Training server connection is not established.")
                 return
-            self.train_server_conn.root.push_game_data(json.dumps(data_store), json.dumps(log))
+            self.train_server_conn.root.push_game_data(data_store["game"])
 
         except Exception as e:
             print(f"Error while sending data to the training server: {str(e)}")
@@ -0,0 +1,176 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from ludo import Ludo, LudoModel, GameConfig
+
+""" This file contains the micro-benchmark suite of the Ludo Engine. Every operation is run over a fixed corpus of positions and its speed (ops/sec) and
+allocations (tracemalloc) are reported. Results can be written to a JSON file and compared against a stored baseline.
+    Usage: python benchmark.py --output bench.json [--baseline baseline.json] [--tolerance 0.2]
+"""
+
+TEAM_CONFIG = [[LudoModel.RED, LudoModel.YELLOW], [LudoModel.GREEN, LudoModel.BLUE]]
+FOUR_PLAYER_CONFIG = [[LudoModel.RED], [LudoModel.GREEN], [LudoModel.YELLOW], [LudoModel.BLUE]]
+
+
+def make_state(model, singles, blocks=(), current_player=0, dice_roll=(6, 4)):
+    """Creates a prepared state from {pawn_id: position} of single pawns and [(pawn1_id, pawn2_id, position, rigid)] of blocks. Pawns of the
+    players which are not mentioned stay in their bases."""
+    state = {"game_over": False, "current_player": current_player, "num_more_moves": 0, "dice_roll": list(dice_roll),
+             "last_move_id": 0, "all_blocks": []}
+    pawns = {pawn.id: pawn for colour in model.pawns for pawn in model.pawns[colour]}
+    blocked = {pawn_id for block in blocks for pawn_id in block[:2]}
+    for i, player in enumerate(model.config.players):
+        single_pawn_pos = {}
+        for colour in model.config.player_colour[i]:
+            for pawn, base in zip(model.pawns[colour], model.bases[colour]):
+                if pawn.id not in blocked:
+                    single_pawn_pos[pawn.id] = singles.get(pawn.id, base)
+        state[player.name] = {"single_pawn_pos": single_pawn_pos, "block_pawn_pos": {}}
+    for pawn1_id, pawn2_id, pos, rigid in blocks:
+        block = model.create_block([pawn1_id, pawn2_id], rigid)
+        state["all_blocks"].append(block)
+        state[model.config.colour_player[pawns[pawn1_id].colour].name]["block_pawn_pos"][block.id] = pos
+    return model.prepare_state(state)
+
+
+def build_corpus():
+    """Returns the fixed corpus of positions as a list of (name, model, state)"""
+    team = LudoModel(GameConfig(TEAM_CONFIG))
+    four = LudoModel(GameConfig(FOUR_PLAYER_CONFIG))
+    return [
+        ("opening", team, make_state(team, {}, dice_roll=(6, 6, 3))),
+        ("opening_4p", four, make_state(four, {"R1": "P2", "G1": "P15", "Y1": "P28"}, current_player=3, dice_roll=(6, 2))),
+        ("midgame_rigid_blocks", team, make_state(team, {"R3": "P20", "R4": "P33", "Y1": "P9", "Y2": "YH2", "G1": "P40", "G2": "P47",
+                                                         "B1": "P5", "B2": "P16", "B3": "P44"},
+                                                  [("R1", "R2", "P24", True), ("Y3", "Y4", "P30", True), ("G3", "G4", "P27", True)],
+                                                  dice_roll=(6, 4))),
+        ("midgame_4p", four, make_state(four, {"R1": "P7", "R2": "P19", "G1": "P21", "G2": "P31", "G3": "GH3", "Y1": "P36", "Y2": "P45",
+                                               "B1": "P50", "B2": "P3", "B3": "P12"},
+                                        [("R3", "R4", "P23", False), ("Y3", "Y4", "P26", True)], current_player=2, dice_roll=(4,))),
+        ("home_stretch_heterogeneous_blocks", team, make_state(team, {"R3": "RH2", "R4": "P40", "Y3": "P14", "Y4": "YH6", "G3": "P8",
+                                                                      "G4": "GH4", "B3": "P30", "B4": "BB4"},
+                                                               [("R1", "Y1", "P52", True), ("R2", "Y2", "P26", True),
+                                                                ("G1", "B1", "P13", True), ("G2", "B2", "P39", True)],
+                                                               current_player=1, dice_roll=(6, 6, 2))),
+        ("endgame", team, make_state(team, {"R1": "RH6", "R2": "RH6", "R3": "RH6", "R4": "RH3", "Y1": "YH6", "Y2": "YH6", "Y3": "P20",
+                                            "Y4": "YH6", "G1": "GH6", "G2": "GH6", "G3": "P9", "G4": "GH1", "B1": "BH6", "B2": "BH6",
+                                            "B3": "BH6", "B4": "P33"}, dice_roll=(3,))),
+    ]
+
+
+def random_playout(model, state, rng):
+    """Plays random moves from the state till the game is over and returns the number of moves taken"""
+    num_moves = 0
+    while not state["game_over"]:
+        state["dice_roll"] = [rng.randint(1, 6)]
+        while state["dice_roll"][-1] == 6 and len(state["dice_roll"]) < 3:
+            state["dice_roll"].append(rng.randint(1, 6))
+        moves = model.possible_moves(state, state["dice_roll"])
+        state = model.generate_next_state(state, rng.choice(moves) if moves else [[]])
+        num_moves += 1
+    return num_moves
+
+
+def operations(model, state):
+    """Returns the benchmarked operations of a position as {name: function}"""
+    moves = model.possible_moves(state, state["dice_roll"])
+    move = moves[0] if moves else [[]]
+    return {
+        "all_possible_moves": lambda: model.all_possible_moves(state),
+        "distinct_moves": lambda: model.distinct_moves(state, state["dice_roll"]),
+        "generate_next_state": lambda: model.generate_next_state(state, move),
+        "state_to_repr": lambda: model.state_to_repr(state),
+        "get_state_jsonable": lambda: model.get_state_jsonable(state),
+        "canonicalize": lambda: model.canonicalize(state),
+        "canonical_hash": lambda: model.canonical_hash(state),
+    }
+
+
+def measure(function, min_time, min_runs):
+    """Returns ops/sec of the function and the allocations of a single call"""
+    # Allocations: number of memory blocks and bytes still held after one call (the result is kept alive) and the peak bytes during the call
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    allocations = {"alloc_blocks": sum(stat.count_diff for stat in diff), "alloc_bytes": sum(stat.size_diff for stat in diff),
+                   "peak_bytes": peak}
+    del result
+
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time or runs < min_runs:
+        function()
+        runs += 1
+        elapsed = time.perf_counter() - start
+    return {"ops_per_sec": runs / elapsed, "runs": runs, **allocations}
+
+
+def run(min_time=0.5, min_runs=3, playouts=5, seed=0):
+    results = {}
+    for name, model, state in build_corpus():
+        # Move caches would turn repeated calls into lookups
+        model.move_cache = None
+        for op_name, function in operations(model, state).items():
+            results[f"{op_name}/{name}"] = measure(function, min_time, min_runs)
+            print(f"{op_name}/{name}: {results[f'{op_name}/{name}']['ops_per_sec']:.1f} ops/sec")
+
+    # Full random playouts from the initial state
+    config = GameConfig(TEAM_CONFIG)
+    rng = random.Random(seed)
+    engine = Ludo(config)
+    engine.model.move_cache = None
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(playouts):
+        engine.reset()
+        moves += random_playout(engine.model, engine.state, rng)
+    elapsed = time.perf_counter() - start
+    results["random_playout"] = {"ops_per_sec": playouts / elapsed, "runs": playouts, "moves_per_sec": moves / elapsed}
+    print(f"random_playout: {results['random_playout']['ops_per_sec']:.2f} games/sec")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints the speed of every benchmark relative to the baseline and returns the names of the regressed ones"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["ops_per_sec"] / baseline[name]["ops_per_sec"]
+        print(f"{name}: {ratio:.2f}x of baseline")
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file of previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before a benchmark is reported as a regression")
+    parser.add_argument("--min_time", type=float, default=0.5, help="Minimum time in seconds spent on every benchmark")
+    parser.add_argument("--playouts", type=int, default=5, help="Number of full random playouts")
+    args = parser.parse_args()
+
+    results = run(min_time=args.min_time, playouts=args.playouts)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version, "platform": platform.platform(), "time": time.time(), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
@@ -9,7 +9,9 @@ from rpyc.utils.helpers import classpartial
 from rpyc.utils.server import ThreadedServer
 from signal import signal, SIGINT, SIGTERM
 import tensorflow as tf
+import numpy as np
 from queue import Queue
+from ludo import LudoCodec, STATE_RECORD
 
 """This file contains stuff related to the evaluator which runs in the background of actor to perform neural network evaluations"""
 
@@ -58,14 +60,16 @@ class EvaluatorService(rpyc.Service):
         """This method is used to request an evaluation for a set of states.
             Arguments:
                 - player_name: name of the player for whom the request is being evaluated
-                - states: serialized tensor of shape (num_states, 59, 21)
+                - states: bytes of the STATE_RECORDs of the states (see LudoCodec.encode_states()). The current player of a record is the player from
+                        whose point of view the state is evaluated.
             Return:
-                - results: serialized tensor of shape (num_states,)
+                - results: bytes of the float32 results of shape (num_states,)
         """
 
         trigger_event = threading.Event()
         # Add the request to the NNet queue
-        elem = QElem(tf.io.parse_tensor(base64.b64decode(states), out_type=tf.float32), trigger_event)
+        records = np.frombuffer(states, dtype=STATE_RECORD)
+        elem = QElem(tf.convert_to_tensor(self.eval_object.codec.records_to_repr(records)), trigger_event)
         self.eval_object.queues[player_name].put(elem)
 
         # Keep checking if all states are completely evaluated when triggered
@@ -75,8 +79,7 @@ class EvaluatorService(rpyc.Service):
             all_complete = elem.is_evaluated()
             trigger_event.clear()
 
-        return base64.b64encode(
-            tf.io.serialize_tensor(elem.result).numpy()).decode('ascii')
+        return elem.result.numpy().astype(np.float32).tobytes()
     
 
 
@@ -95,6 +98,7 @@ class EvaluatorMain:
     def setup_for_new_game(self, players):
         """This method setups up a new game by initializing its players and fetching their corresponding neural network architectures"""
         self.players = players
+        self.codec = LudoCodec.for_config([player["colours"] for player in players])
         self.queues = {}
         for player in self.players:
             self.queues[player["name"]] = Queue()
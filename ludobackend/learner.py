@@ -16,6 +16,7 @@ import numpy as np
 from queue import Queue
 from rpyc import ThreadedServer
 from tensorflow.keras.optimizers import serialize
+from ludo import LudoCodec
 
 
 """ This file contains only stuff related to the learner """
@@ -114,6 +115,18 @@ class DataLoader:
             perm[i, permuted_indices[i]] = 1
         return perm
 
+    def load_game(self, file):
+        """ Loads a game of the experience store. Returns (player_won, num_states, get_states) where get_states(indices) returns the tensor representation
+        of the states at the given indices. Binary games (see LudoCodec) are converted only for the requested states."""
+        if file.suffix == ".bin":
+            with open(file, mode="rb") as f:
+                game = LudoCodec.read_game(f.read())
+            codec = LudoCodec.for_config(game["player_colour"])
+            return game["winner"] + 1, len(game["states"]), lambda indices: codec.records_to_repr(game["states"][indices])
+        with open(file, mode="r", encoding="utf-8") as f:
+            game_data = json.loads(f.read())
+        return game_data["player_won"], len(game_data["states"]), lambda indices: np.array([game_data["states"][i] for i in indices])
+
     def fetch(self):
         """ This function selects some files and fetches one mini-batch from those files and pushes the batch to the pre-fetch queue"""
         states = []
@@ -127,22 +140,16 @@ class DataLoader:
 
             # Load the whole file
             try:
-                with open(self.experience_store_path / file, mode="r", encoding="utf-8") as f:
-                    game_data = json.loads(f.read())
+                winner_player, num_states, get_states = self.load_game(self.experience_store_path / file)
             except:
                 # To maintain max store constraint if the train server has removed the file, read another file
                 file = random.choice(os.listdir(self.experience_store_path))
-                with open(self.experience_store_path / file, mode="r", encoding="utf-8") as f:
-                    game_data = json.loads(f.read())
+                winner_player, num_states, get_states = self.load_game(self.experience_store_path / file)
 
-            # Find who won
-            winner_player = game_data["player_won"]
-            num_states = len(game_data["states"])
             # BATCH_SIZE // NUM_FILES_TO_FETCH_BATCH number of states must be selected
-            for _ in range(BATCH_SIZE // NUM_FILES_TO_FETCH_BATCH):
-                # Choose one state
-                chosen_state = np.random.randint(low=0, high=num_states)
-                state = np.array(game_data["states"][chosen_state])
+            chosen_states = get_states(np.random.randint(low=0, high=num_states, size=BATCH_SIZE // NUM_FILES_TO_FETCH_BATCH))
+            for state in chosen_states:
+                state = np.array(state)
 
                 # Apply turn augmentation
                 player = random.choice(np.unique(state[0, 16:20]))
@@ -1,53 +1,154 @@
+from collections.abc import Sequence
 from copy import deepcopy
-from random import randint
+from random import randint, Random
+import struct
 import numpy as np
+from topology import BoardTopology
+from transposition import TranspositionTable
 
 """ This file contains only stuff related to the implementation of the Ludo Engine """
 
+# Operations recorded in the undo journal of LudoModel.apply_move() and LudoModel.move_pawn()
+_SET, _ADD, _POP, _APPEND, _REMOVE = range(5)
+
+# Seed of the Zobrist keys. It is fixed so that the hash of a state is the same in every process.
+ZOBRIST_SEED = 0x4C75646F
+# Number of distinct num_more_moves values which have their own Zobrist key
+MAX_MORE_MOVES = 64
+
+# All roll sequences in the order used by LudoModel.all_possible_moves(). [6, 6, 6] never has any move.
+POSSIBLE_ROLLS = [[i] for i in range(1, 6)] + [[6, i] for i in range(1, 6)] + [[6, 6, i] for i in range(1, 6)] + [[6, 6, 6]]
+# Id of every roll sequence: its index in POSSIBLE_ROLLS, ROLL_IDS[tuple(roll)]
+ROLL_IDS = {tuple(roll): roll_id for roll_id, roll in enumerate(POSSIBLE_ROLLS)}
+# Exact probability of every roll sequence of POSSIBLE_ROLLS (a roll ends at the first throw which is not a 6 or after three throws)
+ROLL_PROBABILITIES = [1 / 6] * 5 + [1 / 36] * 5 + [1 / 216] * 6
+
+# Binary format of LudoCodec. The version is the first byte of every encoded state, move and game and has to be bumped whenever a layout changes.
+CODEC_VERSION = 1
+BLOCK_RIGID = 0x80  # Flag of the "block" byte of a blocked pawn in a STATE_RECORD
+NO_MOVE = 0xFF  # Number of steps of the empty move [] (no move taken, e.g. from the last state of a game)
+NO_WINNER = 0xFF
+MAX_MOVE_STEPS = 3
+STATE_RECORD = np.dtype([("game_over", "u1"), ("current_player", "u1"), ("num_more_moves", "u1"), ("dice_roll", "u1", (3,)), ("last_move_id", "<u4"),
+                         ("pos", "u1", (16,)), ("block", "u1", (16,))])
+MOVE_RECORD = np.dtype([("num_steps", "u1"), ("steps", "u1", (MAX_MOVE_STEPS, 4))])
+TOP_MOVE_RECORD = np.dtype([("move", MOVE_RECORD), ("prob", "<f4"), ("value", "<f4")])
+# Header of STATE_RECORD and of an encoded game (version, number of players, winner, number of states)
+_STATE_HEADER = struct.Struct("<BBB3BI")
+_GAME_HEADER = struct.Struct("<BBBI")
+
 
 class Player:
-    """This class stores a particular player"""
+    """This class stores a particular player. Players are immutable and interned: creating a player with the same name and colours returns the same
+    object."""
+
+    __slots__ = ("name", "colours")
+    _interned = {}
+
+    def __new__(cls, name, colours):
+        colours = tuple(colours)
+        player = cls._interned.get((name, colours))
+        if player is None:
+            player = super().__new__(cls)
+            object.__setattr__(player, "name", name)
+            object.__setattr__(player, "colours", colours)
+            player = cls._interned.setdefault((name, colours), player)
+        return player
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
 
-    def __init__(self, name, colours):
-        self.name = name
-        self.colours = colours
+    def __reduce__(self):
+        return Player, (self.name, self.colours)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __eq__(self, other):
         return self.name == other.name
 
+    def __hash__(self):
+        return hash(self.name)
+
     def __repr__(self):
         return self.name
 
     def get_dict(self):
-        return {"name": self.name, "colours": self.colours}
+        return {"name": self.name, "colours": list(self.colours)}
 
 
 class Pawn:
-    """This class stores the id and colour of a pawn"""
+    """This class stores the id and colour of a pawn. Pawns are immutable and interned (one object per pawn id), so states share them by reference and
+    copies of a state do not copy them."""
 
-    def __init__(self, id, colour):
-        self.id = id
-        self.colour = colour
+    __slots__ = ("id", "colour")
+    _interned = {}
+
+    def __new__(cls, id, colour):
+        pawn = cls._interned.get((id, colour))
+        if pawn is None:
+            pawn = super().__new__(cls)
+            object.__setattr__(pawn, "id", id)
+            object.__setattr__(pawn, "colour", colour)
+            pawn = cls._interned.setdefault((id, colour), pawn)
+        return pawn
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __reduce__(self):
+        return Pawn, (self.id, self.colour)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __eq__(self, other):
         return self.id == other.id
 
+    def __hash__(self):
+        return hash(self.id)
+
     def __repr__(self):
         return f"Pawn[{self.id},{self.colour}]"
 
 
 class PawnBlock(Pawn):
-    """This class stores a block of pawns. A block of pawns is also considered a pawn.
+    """This class stores a block of pawns. A block of pawns is also considered a pawn. Blocks are immutable and interned like pawns: there is one object
+    per (pawns, rigidity), and a change of rigidity replaces the block of a state with its other variant (see with_rigid()).
         Attributes:
             - id: Block Id
-            - pawns: List of Pawn objects consisting the block
+            - pawns: Tuple of Pawn objects consisting the block
             - rigid: Whether the block can be broken in the next move or not
     """
 
-    def __init__(self, pawns, id="", colour="", rigid=False):
-        super().__init__(id, colour)
-        self.pawns = pawns
-        self.rigid = rigid
+    __slots__ = ("pawns", "rigid")
+    _interned = {}
+
+    def __new__(cls, pawns, id="", colour="", rigid=False):
+        pawns = tuple(pawns)
+        key = (pawns, id, colour, rigid)
+        block = cls._interned.get(key)
+        if block is None:
+            block = object.__new__(cls)
+            object.__setattr__(block, "id", id)
+            object.__setattr__(block, "colour", colour)
+            object.__setattr__(block, "pawns", pawns)
+            object.__setattr__(block, "rigid", rigid)
+            block = cls._interned.setdefault(key, block)
+        return block
+
+    def __reduce__(self):
+        return PawnBlock, (self.pawns, self.id, self.colour, self.rigid)
+
+    def with_rigid(self, rigid):
+        # Returns the same block with the given rigidity
+        return PawnBlock(self.pawns, self.id, self.colour, rigid)
 
     def check_pawn_in_block(self, pawn):
         return pawn in self.pawns
@@ -61,6 +162,9 @@ class PawnBlock(Pawn):
     def __eq__(self, other):
         return self.pawns == other.pawns
 
+    def __hash__(self):
+        return hash(self.pawns)
+
     def __repr__(self):
         return f"Block[{','.join([self.id] + [repr(pawn) for pawn in self.pawns])}]"
 
@@ -94,10 +198,43 @@ class LudoModel:
             - generate_next_state(state, move): This method returns the next state given the current state and move. Note: This method does not validate whether the move is applicable or not.
                                         It expects the move is a valid one. Do not send a move which is invalid. Unknown behaviour will be observed in that case. Moreover, this method does not change
                                         the "dice_roll" value and keeps it as it is since this method does not generate a new roll. New rolls are generated only by the Ludo class.
+            - apply_move(state, move): Same as generate_next_state() but takes the move on the given state in place. Returns an undo journal of all the changes.
+            - undo_move(state, journal): Reverts the changes recorded in the journal returned by apply_move() and brings back the exact previous state.
+            - path_copy(state): Copy of the state which shares the positions of all players with it (used by generate_next_state() of persistent models)
             - all_possible_moves(state): This method returns all possible validated moves from the current state. The return object is described as:
                              return [{"roll": [throw1, throw2,...], "moves": [[[Pawn1, Current Position, Destination Position], [Pawn2, Current Position, Destination Position], [[Pawn3, Pawn4], Current Position, Desctination Position] ...], ... ]}, ...]
+            - possible_moves(state, roll): Returns the validated moves of a single roll, i.e. the "moves" entry of all_possible_moves() for that roll. The moves of
+                             prepared states are kept in an LRU cache (move_cache) by the hash of the state and the roll, so the returned list must not be modified.
             - state_to_repr(state): This method converts the state dictionary to its tensor representation (returns numpy array).
+            - states_to_repr_batch(states, out=None): Converts a list of states to a stacked (N, 59, 21) tensor representation in one go. If out is given, the
+                             representation is written into out[:N] and that view is returned.
             - get_state_jsonable(state): This method convert the state dictionary to a jsonable dictionary
+            - prepare_state(state): Adds the Zobrist hash of the state as state["hash"] and the index of the block of every blocked pawn as
+                             state["pawn_blocks"]. Both are kept up to date by apply_move(), generate_next_state() and undo_move(). The hash covers pawn positions,
+                             block rigidity, current player and num_more_moves.
+            - fetch_block_from_pawn(state, pawn_id), fetch_block_from_id(state, block_id), fetch_block_from_pawn_ids(state, pawn_ids): Block lookups. The id of a
+                             block is "BL" followed by the ids of its pawns in colour order (e.g. "BLR1Y2"), so a block has the same id in every state.
+            - compute_hash(state): Computes the Zobrist hash of the state from scratch
+            - player_has_moves(state, player_index): Whether the player can still take moves (not all pawns finished and not stuck behind a heterogeneous block)
+            - get_winner(state): Returns the index of the winner or None if there is none yet. O(1) for prepared states.
+            - canonicalize(state): Returns (canonical_state, transform). Symmetric states (same up to a permutation of the pawns of a colour and a rotation of
+                             the board which keeps the colours of every player) have the same canonical state. transform is a StateTransform which maps moves
+                             between the state and the canonical state.
+            - canonical_hash(state): Hash of the canonical state without building it
+            - iter_moves(state, roll, with_states=False): Lazily yields the moves of possible_moves() (and their next states if with_states is True)
+            - has_legal_move(state, roll), count_moves(state, roll), is_legal_move(state, roll, move): Short-circuiting helpers over iter_moves()
+            - distinct_moves(state, roll): Same as possible_moves() but moves leading to symmetric next states are collapsed into one representative.
+                             Returns (moves, multiplicities).
+        Attributes:
+            - transposition_table: Optional TranspositionTable (see transposition.py). If given, all_possible_moves() and generate_next_state() of prepared
+                             states are memoized by the hash of the state. Memoized results are shared, so the moves returned must not be modified.
+            - move_cache: LRU TranspositionTable of move_cache_size entries used by possible_moves() (None if move_cache_size is 0)
+            - blocks: Interned PawnBlock of every pair of pawns as blocks[rigid][(pawn1_id, pawn2_id)] (see create_block(pawn_ids, rigid=False)). Pawns and
+                             blocks are immutable and shared by all states, so copies of a state only copy its dictionaries.
+            - persistent: If True, generate_next_state() returns persistent states: the next state shares the positions of every player which the move does
+                             not change with the given state (path copying) instead of being a deep copy. The positions of such states must never be changed in
+                             place, only through generate_next_state() or on a deepcopy().
+            - codec: LudoCodec of the model which converts states, moves and games to and from compact binary records
     """
 
 
@@ -106,8 +243,11 @@ class LudoModel:
     YELLOW = "yellow"
     BLUE = "blue"
 
-    def __init__(self, config):
+    def __init__(self, config, transposition_table=None, move_cache_size=4096, persistent=False):
         self.config = config
+        self.transposition_table = transposition_table
+        self.persistent = persistent
+        self.move_cache = TranspositionTable(move_cache_size) if move_cache_size else None
         self.main_track = [f"P{i + 1}" for i in range(52)]
         self.tracks = {LudoModel.RED: self.main_track[1:52] + [f"RH{i + 1}" for i in range(6)],
                        LudoModel.GREEN: self.main_track[14:] + self.main_track[:13] + [f"GH{i + 1}" for i in range(6)],
@@ -124,7 +264,53 @@ class LudoModel:
                       LudoModel.GREEN: [Pawn(f"G{i + 1}", LudoModel.GREEN) for i in range(4)],
                       LudoModel.YELLOW: [Pawn(f"Y{i + 1}", LudoModel.YELLOW) for i in range(4)],
                       LudoModel.BLUE: [Pawn(f"B{i + 1}", LudoModel.BLUE) for i in range(4)]}
-        self.last_block_id = 0
+        # Interned blocks of every pair of pawns (pawns in colour order) by rigidity: blocks[rigid][(pawn1_id, pawn2_id)], both orders of the ids
+        all_pawns = [pawn for colour in self.pawns for pawn in self.pawns[colour]]
+        self.blocks = {rigid: {} for rigid in (False, True)}
+        for i, pawn1 in enumerate(all_pawns):
+            for pawn2 in all_pawns[i + 1:]:
+                for rigid in (False, True):
+                    block = PawnBlock([pawn1, pawn2], self.get_block_id([pawn1, pawn2]), rigid=rigid)
+                    self.blocks[rigid][(pawn1.id, pawn2.id)] = self.blocks[rigid][(pawn2.id, pawn1.id)] = block
+        self.topology = BoardTopology(self.main_track, self.tracks, self.bases, self.stars, self.finale_positions)
+        self.other_players = [[player for idx, player in enumerate(self.config.players) if idx != player_idx] for player_idx
+                              in range(len(self.config.players))]
+        # Rows and columns of the tensor representation (see state_to_repr)
+        self.repr_rows = {pos: int(pos[1:]) if pos[0] == "P" else 52 + int(pos[2:]) if pos[1] == "H" else 0 for pos in
+                          self.topology.square_index}
+        self.repr_cols = {pawn.id: i for i, pawn in enumerate(pawn for colour in self.pawns for pawn in self.pawns[colour])}
+        self.repr_player_cols = [(16 + list(self.pawns).index(colour), player_idx + 1) for player_idx, colours in
+                                 enumerate(self.config.player_colour) for colour in colours]
+        # Player of every pawn in the game and the number of pawns of every player
+        self.pawn_player_name = {pawn.id: player.name for player in self.config.players for colour in player.colours for pawn in self.pawns[colour]}
+        self.player_num_pawns = [4 * len(colours) for colours in self.config.player_colour]
+        # A rigid heterogeneous block on one of these positions cannot move any further (see check_block_no_moves_player())
+        self.blocked = {LudoModel.RED: "P52", LudoModel.BLUE: "P39", LudoModel.GREEN: "P13", LudoModel.YELLOW: "P26"}
+        # Zobrist keys: single pawn positions, blocked pawn positions (separately for non-rigid and rigid blocks), current player and num_more_moves
+        rng = Random(ZOBRIST_SEED)
+        pawn_ids = [pawn.id for colour in self.pawns for pawn in self.pawns[colour]]
+        self.zobrist_single = {pawn_id: {pos: rng.getrandbits(64) for pos in self.topology.square_index} for pawn_id in pawn_ids}
+        self.zobrist_block = {rigid: {pawn_id: {pos: rng.getrandbits(64) for pos in self.topology.square_index} for pawn_id in pawn_ids}
+                              for rigid in (False, True)}
+        self.zobrist_player = [rng.getrandbits(64) for _ in self.config.players]
+        self.zobrist_more_moves = [rng.getrandbits(64) for _ in range(MAX_MORE_MOVES)]
+        self.codec = LudoCodec(self)
+        # Symmetries (see canonicalize()): rotations of the board by whole colours (13 squares) which map the colours of every player onto its own colours,
+        # along with the rotated position of every position and the rotated pawn index (codec order) of every pawn
+        colours = list(self.pawns)
+        self.symmetry_rotations = [r for r in range(4) if all(sorted(colours[(colours.index(colour) + r) % 4] for colour in player_colours) ==
+                                                                  sorted(player_colours) for player_colours in self.config.player_colour)]
+        self.rotated_positions = {r: {pos: self.rotate_position(pos, r) for pos in self.topology.square_index} for r in self.symmetry_rotations}
+        self.rotated_squares = {r: [0] + [self.topology.square_index[self.rotated_positions[r][pos]] for pos in self.topology.squares[1:]] for r in
+                                self.symmetry_rotations}
+        self.rotated_pawns = {r: [4 * ((i // 4 + r) % 4) + i % 4 for i in range(16)] for r in self.symmetry_rotations}
+        # Keys of the canonical hash: a pawn adds the key of its colour, kind (0: single, 1: in a block, 2: in a rigid block) and position. All base
+        # positions of a colour share one key since pawns of the same colour are interchangeable.
+        self.base_squares = {self.topology.square_index[pos] for colour in self.bases for pos in self.bases[colour]}
+        self.pawn_base_squares = [self.topology.square_index[pos] for colour in self.bases for pos in self.bases[colour]]
+        self.square_class = [self.pawn_base_squares[4 * colours.index(self.get_colour_from_id(pos))] if square in self.base_squares else square for
+                             square, pos in enumerate(self.topology.squares)]
+        self.symmetry_keys = [[[rng.getrandbits(64) for _ in self.topology.squares] for _ in colours] for _ in range(3)]
 
     def generate_dice_roll(self):
         roll = []
@@ -146,23 +332,36 @@ class LudoModel:
             return LudoModel.BLUE
 
 
-    def get_new_block_id(self):
-        self.last_block_id += 1
-        return f"BL{self.last_block_id}"
+    def get_block_id(self, pawns):
+        # The id of a block is derived from its pawns (which are always in colour order) so that the same block has the same id in every state
+        return "BL" + "".join(pawn.id for pawn in pawns)
 
-    def fetch_block_from_id(self, state, block_id):
-        block = None
-        for b in state["all_blocks"]:
-            if b.id == block_id:
-                block = b
-                break
-        return block
+    def create_block(self, pawn_ids, rigid=False):
+        # Returns the interned block of the two pawns (in any order)
+        return self.blocks[rigid][tuple(pawn_ids)]
 
-    def fetch_block_from_pawn_ids(self, state, pawn_ids):
+    def fetch_block_from_pawn(self, state, pawn_id):
+        # Returns the block of the pawn or None if the pawn is not blocked
+        if "pawn_blocks" in state:
+            return state["pawn_blocks"].get(pawn_id)
+        for block in state["all_blocks"]:
+            if block.check_pawn_ids([pawn_id]):
+                return block
+
+    def fetch_block_from_id(self, state, block_id):
+        # Block ids are "BL" followed by the two pawn ids
+        if "pawn_blocks" in state:
+            block = state["pawn_blocks"].get(block_id[2:4])
+            return block if block is not None and block.id == block_id else None
         for block in state["all_blocks"]:
-            if block.check_pawn_ids(pawn_ids):
+            if block.id == block_id:
                 return block
 
+    def fetch_block_from_pawn_ids(self, state, pawn_ids):
+        block = self.fetch_block_from_pawn(state, pawn_ids[0])
+        if block is not None and block.check_pawn_ids(pawn_ids):
+            return block
+
     def find_next_possible_pawns(self, state):
         # Collect all next possible pawns
         current_player = self.config.players[state["current_player"]]
@@ -171,7 +370,7 @@ class LudoModel:
         for pawn_id in state[current_player.name]["single_pawn_pos"].keys():
             position = state[self.config.colour_player[self.get_colour_from_id(pawn_id)].name]["single_pawn_pos"][
                 pawn_id]
-            if position not in self.finale_positions:
+            if position not in self.topology.finale_positions:
                 next_possible_pawns["single_pawns"].append([pawn_id, position])
         # Single pawn forward with block
         blocks = []
@@ -189,7 +388,7 @@ class LudoModel:
         # Block pawn forward unblocked after star or unrigid block
         for block_id, block_pos in state[current_player.name]["block_pawn_pos"].items():
             block = self.fetch_block_from_id(state, block_id)
-            if block_pos in self.stars or not block.rigid:
+            if block_pos in self.topology.stars or not block.rigid:
                 for pawn in block.pawns:
                     next_possible_pawns["single_pawns"].append([pawn.id, block_pos])
         return next_possible_pawns
@@ -206,40 +405,32 @@ class LudoModel:
     def validate_pawn_move(self, state, roll, current_pos, pawn):
         # Calculate whether the move is valid given the state configuration and return the new positions of the pawns
         current_player = self.config.players[state["current_player"]]
+        topology = self.topology
 
         # TO VERIFY:
         # Single pawns:
         if isinstance(pawn, str):
             colour = self.get_colour_from_id(pawn)
             position = current_pos
+            track = self.tracks[colour]
+            index = topology.track_index[colour][position]
             # Pawns only go to it's track only on 6 roll.
-            if position in self.bases[colour] and roll != 6:
-                return False, None
-            if position in self.bases[colour] and roll == 6:
-                return True, self.tracks[colour][0]
+            if index < 0:
+                return (True, track[0]) if roll == 6 else (False, None)
             # Pawns cannot jump beyond its track
-            track = self.tracks[colour]
-            index = track.index(position)
             if index + roll >= len(track):
                 return False, None
             # Pawns cannot jump over other pawn blocks except pos is a home star
-            other_players = [player for idx, player in enumerate(self.config.players) if idx != state["current_player"]]
-            for i in range(index + 1, index + roll):
-                pos = track[i]
-                for other_player in other_players:
-                    for _, block_pos in state[other_player.name]["block_pawn_pos"].items():
-                        if pos == block_pos and pos not in self.stars[:4]:
-                            return False, None
+            jump_mask = topology.jump_masks[colour][index][roll]
+            if jump_mask and jump_mask & topology.blockade_mask(state, self.other_players[state["current_player"]]):
+                return False, None
             # Pawns cannot move to a destination if the same player's one block and one single pawn is present except home star
             destination = track[index + roll]
-            for _, block_pos in state[current_player.name]["block_pawn_pos"].items():
-                if destination == block_pos and destination not in self.stars[:4]:
-                    for _, single_pos in state[current_player.name]["single_pawn_pos"].items():
-                        if destination == single_pos:
-                            return False, None
+            if destination not in topology.home_stars and destination in state[current_player.name]["block_pawn_pos"].values() \
+                    and destination in state[current_player.name]["single_pawn_pos"].values():
+                return False, None
         # Block Pawns:
         else:
-            # block_id = self.fetch_block_from_pawn_ids(state, pawn).id
             # Move is possible only if roll%2 == 0
             if roll % 2 != 0:
                 return False, None
@@ -250,96 +441,313 @@ class LudoModel:
             pawn1_track = self.tracks[pawn1_colour]
             pawn2_track = self.tracks[pawn2_colour]
             # Block Pawns cannot jump beyond their track
-            pawn1_index = pawn1_track.index(position)
-            if pawn1_index + roll // 2 >= len(pawn1_track) or pawn2_track.index(position) + roll // 2 >= len(
-                    pawn2_track):
+            pawn1_index = topology.track_index[pawn1_colour][position]
+            pawn2_index = topology.track_index[pawn2_colour][position]
+            if pawn1_index + roll // 2 >= len(pawn1_track) or pawn2_index + roll // 2 >= len(pawn2_track):
                 return False, None
             # Move is possible only if both BlockPawns land at the same place after moving
-            if pawn1_track[pawn1_track.index(position) + roll // 2] != pawn2_track[
-                pawn2_track.index(position) + roll // 2]:
+            if pawn1_track[pawn1_index + roll // 2] != pawn2_track[pawn2_index + roll // 2]:
                 return False, None
             # Block Pawns cannot jump over other pawn blocks except pos is a home star
-            other_players = [player for idx, player in enumerate(self.config.players) if idx != state["current_player"]]
-            for i in range(pawn1_index + 1, pawn1_index + roll // 2):
-                pos = pawn1_track[i]
-                for other_player in other_players:
-                    for _, block_pos in state[other_player.name]["block_pawn_pos"].items():
-                        if pos == block_pos and pos not in self.stars[:4]:
-                            return False, None
+            jump_mask = topology.jump_masks[pawn1_colour][pawn1_index][roll // 2]
+            if jump_mask and jump_mask & topology.blockade_mask(state, self.other_players[state["current_player"]]):
+                return False, None
             # Block Pawns cannot move to a destination if the same player's another block is present
             destination = pawn1_track[pawn1_index + roll // 2]
-            for _, block_pos in state[current_player.name]["block_pawn_pos"].items():
-                if destination == block_pos:
-                    return False, None
+            if destination in state[current_player.name]["block_pawn_pos"].values():
+                return False, None
         return True, destination
 
-    def __generate_next_state(self, state, roll, current_pos, pawn):
-        state = deepcopy(state)
+    # ============= In-place state updates =======================
+    # Every mutation of a state done by the move application code goes through these helpers so that it can be recorded in
+    # an undo journal. A journal is a list of entries which undo_move() replays in reverse order to restore the state exactly
+    # (including the order of the pawns in the position dictionaries, which decides the order of generated moves).
+
+    def _set(self, journal, d, key, value):
+        if journal is not None:
+            journal.append((_SET, d, key, d[key]) if key in d else (_ADD, d, key))
+        d[key] = value
+
+    def _pop(self, journal, d, key):
+        if journal is not None:
+            journal.append((_POP, d, key, d[key], list(d).index(key)))
+        return d.pop(key)
+
+    def _add_block(self, journal, state, block):
+        if journal is not None:
+            journal.append((_APPEND, state["all_blocks"]))
+        state["all_blocks"].append(block)
+        if "pawn_blocks" in state:
+            for p in block.pawns:
+                self._set(journal, state["pawn_blocks"], p.id, block)
+
+    def _remove_block(self, journal, state, block):
+        if journal is not None:
+            journal.append((_REMOVE, state["all_blocks"], state["all_blocks"].index(block), block))
+        state["all_blocks"].remove(block)
+        if "pawn_blocks" in state:
+            for p in block.pawns:
+                self._pop(journal, state["pawn_blocks"], p.id)
+
+    def _set_rigid(self, journal, state, block_pawn_pos, block, rigid):
+        # Blocks are immutable, so the block is replaced by its variant of the given rigidity in all_blocks and pawn_blocks. Returns the new block.
+        if block.rigid == rigid:
+            return block
+        new_block = block.with_rigid(rigid)
+        pos = block_pawn_pos[block.id]
+        if "hash" in state:
+            state["hash"] ^= self.block_hash(block, pos) ^ self.block_hash(new_block, pos)
+        index = state["all_blocks"].index(block)
+        if journal is not None:
+            journal.append((_SET, state["all_blocks"], index, block))
+        state["all_blocks"][index] = new_block
+        if "pawn_blocks" in state:
+            for p in block.pawns:
+                self._set(journal, state["pawn_blocks"], p.id, new_block)
+        self._count(journal, state, "stuck", block.pawns[0].id, self.block_stuck(new_block, pos) - self.block_stuck(block, pos))
+        return new_block
+
+    def _count(self, journal, state, counter, pawn_id, delta):
+        # Adds delta to the "finished" or "stuck" counter of the player of the pawn
+        if delta and counter in state:
+            player_name = self.pawn_player_name[pawn_id]
+            self._set(journal, state[counter], player_name, state[counter][player_name] + delta)
+
+    # The position helpers below also keep the Zobrist hash of a prepared state up to date. The hash itself is recorded in the
+    # journal once at the beginning of apply_move() and move_pawn().
+
+    def _set_single(self, journal, state, single_pawn_pos, pawn_id, pos):
+        old_pos = single_pawn_pos.get(pawn_id)
+        if "hash" in state:
+            if old_pos is not None:
+                state["hash"] ^= self.zobrist_single[pawn_id][old_pos]
+            state["hash"] ^= self.zobrist_single[pawn_id][pos]
+        finale_positions = self.topology.finale_positions
+        self._count(journal, state, "finished", pawn_id, (pos in finale_positions) - (old_pos in finale_positions))
+        self._set(journal, single_pawn_pos, pawn_id, pos)
+
+    def _pop_single(self, journal, state, single_pawn_pos, pawn_id):
+        if "hash" in state:
+            state["hash"] ^= self.zobrist_single[pawn_id][single_pawn_pos[pawn_id]]
+        self._count(journal, state, "finished", pawn_id, -(single_pawn_pos[pawn_id] in self.topology.finale_positions))
+        return self._pop(journal, single_pawn_pos, pawn_id)
+
+    def _set_block(self, journal, state, block_pawn_pos, block, pos):
+        old_pos = block_pawn_pos.get(block.id)
+        if "hash" in state:
+            if old_pos is not None:
+                state["hash"] ^= self.block_hash(block, old_pos)
+            state["hash"] ^= self.block_hash(block, pos)
+        self._count(journal, state, "stuck", block.pawns[0].id, self.block_stuck(block, pos) - self.block_stuck(block, old_pos))
+        self._set(journal, block_pawn_pos, block.id, pos)
+
+    def _pop_block(self, journal, state, block_pawn_pos, block):
+        if "hash" in state:
+            state["hash"] ^= self.block_hash(block, block_pawn_pos[block.id])
+        self._count(journal, state, "stuck", block.pawns[0].id, -self.block_stuck(block, block_pawn_pos[block.id]))
+        return self._pop(journal, block_pawn_pos, block.id)
+
+    def _unshare(self, journal, state, shared, player_name):
+        # Path copying: the positions of a player which are still shared with other states are copied before their first change
+        if shared and player_name in shared:
+            shared.discard(player_name)
+            positions = state[player_name]
+            self._set(journal, state, player_name, {"single_pawn_pos": dict(positions["single_pawn_pos"]),
+                                                    "block_pawn_pos": dict(positions["block_pawn_pos"])})
+
+    def _set_turn(self, journal, state, key, value):
+        # Sets "current_player" or "num_more_moves" of the state
+        if "hash" in state:
+            keys = self.zobrist_player if key == "current_player" else self.zobrist_more_moves
+            state["hash"] ^= keys[state[key]] ^ keys[value]
+        self._set(journal, state, key, value)
+
+    # ============= Symmetries =======================
+
+    def rotate_position(self, pos, rotation):
+        # Returns the position reached by rotating the board by the given number of colours (a colour goes to the next one in the order of self.pawns)
+        if pos[0] == "P":
+            return f"P{(int(pos[1:]) - 1 + 13 * rotation) % 52 + 1}"
+        colours = list(self.pawns)
+        colour = colours[(colours.index(self.get_colour_from_id(pos)) + rotation) % 4]
+        return colour[0].upper() + pos[1:]
+
+    def canonical_hash(self, state):
+        """Returns a hash of the state which is the same for all symmetric states (see canonicalize()). Pawns are hashed as an unordered multiset of
+        (colour, kind, position) so no sorting is needed, and the smallest hash over the symmetry rotations is taken."""
+        codec = self.codec
+        pawns = []
+        for player in self.config.players:
+            for pawn_id, pos in state[player.name]["single_pawn_pos"].items():
+                pawns.append((0, codec.pawn_index[pawn_id], self.topology.square_index[pos]))
+            for block_id, pos in state[player.name]["block_pawn_pos"].items():
+                block = self.fetch_block_from_id(state, block_id)
+                for pawn in block.pawns:
+                    pawns.append((1 + block.rigid, codec.pawn_index[pawn.id], self.topology.square_index[pos]))
+        keys, square_class = self.symmetry_keys, self.square_class
+        h = min(sum(keys[kind][(pawn // 4 + r) % 4][square_class[rotated_squares[square]]] for kind, pawn, square in pawns) & 0xFFFFFFFFFFFFFFFF
+                for r, rotated_squares in self.rotated_squares.items())
+        return h ^ self.zobrist_player[state["current_player"]] ^ self.zobrist_more_moves[state["num_more_moves"]]
+
+    def canonicalize(self, state):
+        """Returns (canonical_state, transform). canonical_state is the same prepared state for all states which are equal up to a permutation of the
+        pawns of a colour and a symmetry rotation of the board that keeps the colours of every player, so it can be used as the key of caches. transform
+        is the StateTransform which maps the state to canonical_state; use transform.inverse_move() to map the moves of canonical_state back."""
+        codec = self.codec
+        data = codec.encode_states([state]).tobytes()
+        header_size, num_pawns = STATE_RECORD.itemsize - 32, 16
+        pos, block = data[header_size: header_size + num_pawns], data[header_size + num_pawns:]
+        best = None
+        for r in self.symmetry_rotations:
+            rotated_squares, rotated_pawns = self.rotated_squares[r], self.rotated_pawns[r]
+            # Position, kind and block partner of every pawn after the rotation
+            new_pos, kind, partner = [0] * num_pawns, [0] * num_pawns, [-1] * num_pawns
+            for p in range(num_pawns):
+                q = rotated_pawns[p]
+                new_pos[q] = rotated_squares[pos[p]]
+                if block[p]:
+                    kind[q] = 2 if block[p] & BLOCK_RIGID else 1
+                    partner[q] = rotated_pawns[(block[p] & ~BLOCK_RIGID) - 1]
+            # The pawns of every colour are renumbered in the order of (position, kind, colour of the block partner). Pawns in the base take the base
+            # position of their new number.
+            pawn_map = [0] * num_pawns
+            for c in range(4):
+                order = sorted(range(4 * c, 4 * c + 4), key=lambda q: (0 if new_pos[q] in self.base_squares else new_pos[q], kind[q], partner[q] // 4))
+                for rank, q in enumerate(order):
+                    pawn_map[q] = 4 * c + rank
+            canonical_pos, canonical_block = bytearray(num_pawns), bytearray(num_pawns)
+            for q in range(num_pawns):
+                i = pawn_map[q]
+                canonical_pos[i] = self.pawn_base_squares[i] if new_pos[q] in self.base_squares else new_pos[q]
+                if kind[q]:
+                    canonical_block[i] = (pawn_map[partner[q]] + 1) | (BLOCK_RIGID if kind[q] == 2 else 0)
+            candidate = bytes(canonical_pos + canonical_block)
+            if best is None or candidate < best[0]:
+                best = candidate, r, [pawn_map[rotated_pawns[p]] for p in range(num_pawns)]
+        candidate, r, pawn_map = best
+        canonical_state = codec.decode_states(np.frombuffer(data[:header_size] + candidate, dtype=STATE_RECORD))[0]
+        return canonical_state, StateTransform(self, r, {codec.pawn_ids[p]: codec.pawn_ids[pawn_map[p]] for p in range(num_pawns)})
+
+    # ============= Zobrist hashing =======================
+
+    def block_hash(self, block, pos):
+        keys = self.zobrist_block[block.rigid]
+        return keys[block.pawns[0].id][pos] ^ keys[block.pawns[1].id][pos]
+
+    def compute_hash(self, state):
+        blocks = {block.id: block for block in state["all_blocks"]}
+        h = self.zobrist_player[state["current_player"]] ^ self.zobrist_more_moves[state["num_more_moves"]]
+        for player in self.config.players:
+            for pawn_id, pos in state[player.name]["single_pawn_pos"].items():
+                h ^= self.zobrist_single[pawn_id][pos]
+            for block_id, pos in state[player.name]["block_pawn_pos"].items():
+                h ^= self.block_hash(blocks[block_id], pos)
+        return h
+
+    def prepare_state(self, state):
+        # Adds the pawn to block index, the game over counters and the Zobrist hash to the state
+        state["pawn_blocks"] = {pawn.id: block for block in state["all_blocks"] for pawn in block.pawns}
+        state["finished"], state["stuck"] = {}, {}
+        for player in self.config.players:
+            state["finished"][player.name] = len([pos for pos in state[player.name]["single_pawn_pos"].values() if
+                                                  pos in self.topology.finale_positions])
+            state["stuck"][player.name] = sum(self.block_stuck(self.fetch_block_from_id(state, block_id), pos) for block_id, pos in
+                                              state[player.name]["block_pawn_pos"].items())
+        state["hash"] = self.compute_hash(state)
+        return state
+
+    # ============= Game over and winner =======================
+
+    def block_stuck(self, block, pos):
+        # 1 if the block is a rigid heterogeneous block at the top of the home stretch of one of its colours, else 0
+        return int(block.rigid and block.pawns[0].colour != block.pawns[1].colour and
+                   (pos == self.blocked[block.pawns[0].colour] or pos == self.blocked[block.pawns[1].colour]))
+
+    def player_has_moves(self, state, player_index):
+        # A player has moves left if it is not stuck behind a heterogeneous block and not all of its pawns are in finale positions
+        if "finished" in state:
+            player = self.config.players[player_index]
+            return not state["stuck"][player.name] and state["finished"][player.name] < self.player_num_pawns[player_index]
+        player = self.config.players[player_index]
+        return any(self.check_available_moves(state, colour, player) for colour in player.colours)
+
+    def get_winner(self, state):
+        """Returns the index of the winner of the state or None if there is no winner yet. The winner is the first player (in config order) whose pawns are
+        all in finale positions, else the current player if the game is over since the other players have no moves left."""
+        for player_index in range(len(self.config.players)):
+            if self.check_all_pawns_in_finale(state, player_index):
+                return player_index
+        if state["game_over"]:
+            return state["current_player"]
+        return None
+
+    def move_pawn(self, state, roll, current_pos, pawn, journal=None, shared=None):
+        """Moves a single pawn or a block of pawns on the state in place and returns the number of extra moves earned by the movement.
+        If a journal (list) is given, every change done on the state is recorded in it so that undo_move() can revert it. shared is the set of names
+        of the players whose positions are shared with other states, they are copied before they are changed (see generate_next_state())."""
         num_more_moves = 0
+        topology = self.topology
         current_player = self.config.players[state["current_player"]]
+        self._unshare(journal, state, shared, current_player.name)
+        single_pawn_pos = state[current_player.name]["single_pawn_pos"]
+        block_pawn_pos = state[current_player.name]["block_pawn_pos"]
+        if "hash" in state:
+            self._set(journal, state, "hash", state["hash"])
         # If single pawn, find next position and update it.
         if isinstance(pawn, str):
             colour = self.get_colour_from_id(pawn)
             position = current_pos
             track = self.tracks[colour]
-            try:
-                index = track.index(position)
-            except:
-                index = -6
-            destination = track[index + roll]
+            destination = track[topology.track_index[colour][position] + roll]
 
-            state[current_player.name]["single_pawn_pos"][pawn] = destination
+            self._set_single(journal, state, single_pawn_pos, pawn, destination)
 
             # If pawn is in a block, dissolve the block, leave the other pawn in old position
-            for block in state["all_blocks"]:
-                if pawn in [p.id for p in block.pawns]:
-                    old_pos = state[current_player.name]["block_pawn_pos"][block.id]
-                    state[current_player.name]["block_pawn_pos"].pop(block.id)
-                    other_pawn_id = block.pawns[0].id if block.pawns[0].id != pawn else block.pawns[1].id
-                    state[current_player.name]["single_pawn_pos"][other_pawn_id] = old_pos
-                    state["all_blocks"].remove(block)
-                    break
+            block = self.fetch_block_from_pawn(state, pawn)
+            if block is not None:
+                old_pos = self._pop_block(journal, state, block_pawn_pos, block)
+                other_pawn_id = block.pawns[0].id if block.pawns[0].id != pawn else block.pawns[1].id
+                self._set_single(journal, state, single_pawn_pos, other_pawn_id, old_pos)
+                self._remove_block(journal, state, block)
 
             # If at current position two pawns are present and current position is not home star, block them up (non-rigid)
-            pawns_at_current = [p_id for p_id, pos in state[current_player.name]["single_pawn_pos"].items() if
-                                pos == position and pos not in self.stars[:4]]
+            pawns_at_current = [p_id for p_id, pos in single_pawn_pos.items() if
+                                pos == position and pos not in topology.home_stars]
             if len(pawns_at_current) >= 2:
-                state[current_player.name]["single_pawn_pos"].pop(pawns_at_current[0])
-                state[current_player.name]["single_pawn_pos"].pop(pawns_at_current[1])
-                block = PawnBlock([p for p in
-                                   self.pawns[LudoModel.RED] + self.pawns[LudoModel.GREEN] + self.pawns[LudoModel.YELLOW] +
-                                   self.pawns[LudoModel.BLUE] if p.id in pawns_at_current[:2]], self.get_new_block_id())
-                state["all_blocks"].append(block)
-                state[current_player.name]["block_pawn_pos"][block.id] = position
+                self._pop_single(journal, state, single_pawn_pos, pawns_at_current[0])
+                self._pop_single(journal, state, single_pawn_pos, pawns_at_current[1])
+                block = self.create_block(pawns_at_current[:2])
+                self._add_block(journal, state, block)
+                self._set_block(journal, state, block_pawn_pos, block, position)
 
             # If another single pawn of other player is present at destination position (except stars), capture it by sending it back to its base
-            other_players = [player for idx, player in enumerate(self.config.players) if idx != state["current_player"]]
-            for other_player in other_players:
+            for other_player in self.other_players[state["current_player"]]:
+                if destination in topology.stars:
+                    break
                 for pawn_id, pos in state[other_player.name]["single_pawn_pos"].items():
-                    if destination == pos and destination not in self.stars:
-                        state[other_player.name]["single_pawn_pos"][pawn_id] = \
-                            self.bases[self.get_colour_from_id(pawn_id)][int(pawn_id[1:]) - 1]
+                    if destination == pos:
+                        self._unshare(journal, state, shared, other_player.name)
+                        self._set_single(journal, state, state[other_player.name]["single_pawn_pos"], pawn_id,
+                                         self.bases[self.get_colour_from_id(pawn_id)][int(pawn_id[1:]) - 1])
                         num_more_moves += 1
                         break
 
             # If another single pawn of same player is present at destination position, block it with other pawn by default except the home star positions and finale position
-            for pawn_id, pos in state[current_player.name]["single_pawn_pos"].items():
-                if destination == pos and pawn_id != pawn and destination not in self.stars[:4] + self.finale_positions:
-                    state[current_player.name]["single_pawn_pos"].pop(pawn_id)
-                    state[current_player.name]["single_pawn_pos"].pop(pawn)
-                    block = PawnBlock([p for p in
-                                       self.pawns[LudoModel.RED] + self.pawns[LudoModel.GREEN] + self.pawns[LudoModel.YELLOW] +
-                                       self.pawns[LudoModel.BLUE] if p.id in [pawn_id, pawn]], self.get_new_block_id())
-                    state["all_blocks"].append(block)
-                    state[current_player.name]["block_pawn_pos"][block.id] = destination
+            for pawn_id, pos in single_pawn_pos.items():
+                if destination == pos and pawn_id != pawn and destination not in topology.safe_positions:
+                    self._pop_single(journal, state, single_pawn_pos, pawn_id)
+                    self._pop_single(journal, state, single_pawn_pos, pawn)
+                    block = self.create_block([pawn_id, pawn])
+                    self._add_block(journal, state, block)
+                    self._set_block(journal, state, block_pawn_pos, block, destination)
                     break
 
             # If destination is finale and not all other pawns in finale position, give another move
-            if destination in self.finale_positions and len(
-                    [pos for pawn_id, pos in state[current_player.name]["single_pawn_pos"].items() if
-                     pos not in self.finale_positions] + [pos for b_id, pos in
-                                                          state[current_player.name]["block_pawn_pos"].items() if
-                                                          pos not in self.finale_positions]) > 0:
+            if destination in topology.finale_positions and len(
+                    [pos for pawn_id, pos in single_pawn_pos.items() if
+                     pos not in topology.finale_positions] + [pos for b_id, pos in
+                                                              block_pawn_pos.items() if
+                                                              pos not in topology.finale_positions]) > 0:
                 num_more_moves += 1
 
         # If Block pawn, find next position and update it.
@@ -348,60 +756,77 @@ class LudoModel:
             position = current_pos
             pawn1_colour = self.get_colour_from_id(pawn1_id)
             pawn1_track = self.tracks[pawn1_colour]
-            index = pawn1_track.index(position)
-            destination = pawn1_track[index + roll // 2]
-
-            if position in self.stars[:4]:
-                block = PawnBlock([p for p in
-                                   self.pawns[LudoModel.RED] + self.pawns[LudoModel.GREEN] + self.pawns[LudoModel.YELLOW] +
-                                   self.pawns[LudoModel.BLUE] if p.id in pawn], self.get_new_block_id())
-                state["all_blocks"].append(block)
+            destination = pawn1_track[topology.track_index[pawn1_colour][position] + roll // 2]
+
+            if position in topology.home_stars:
+                block = self.create_block(pawn)
+                self._add_block(journal, state, block)
             else:
                 block = self.fetch_block_from_pawn_ids(state, pawn)
             block_id = block.id
-            state[current_player.name]["block_pawn_pos"][block_id] = destination
+            self._set_block(journal, state, block_pawn_pos, block, destination)
 
             # If another Block pawn of other player is present at destination position (except stars), capture them by breaking the block and sending them back to their respective bases
-            other_players = [player for idx, player in enumerate(self.config.players) if idx != state["current_player"]]
-            for other_player in other_players:
+            for other_player in self.other_players[state["current_player"]]:
+                if destination in topology.stars:
+                    break
                 for b_id, pos in state[other_player.name]["block_pawn_pos"].items():
-                    if destination == pos and destination not in self.stars:
+                    if destination == pos:
+                        self._unshare(journal, state, shared, other_player.name)
                         b = self.fetch_block_from_id(state, b_id)
-                        state["all_blocks"].remove(b)
-                        state[other_player.name]["block_pawn_pos"].pop(b_id)
+                        self._remove_block(journal, state, b)
+                        self._pop_block(journal, state, state[other_player.name]["block_pawn_pos"], b)
                         for p in b.pawns:
-                            state[other_player.name]["single_pawn_pos"][p.id] = \
-                                self.bases[self.get_colour_from_id(p.id)][int(p.id[1:]) - 1]
+                            self._set_single(journal, state, state[other_player.name]["single_pawn_pos"], p.id,
+                                             self.bases[self.get_colour_from_id(p.id)][int(p.id[1:]) - 1])
                         num_more_moves += 2
                         break
 
             # If destination is home or finale position , break the block into single pawns
-            if destination in self.finale_positions + self.stars[:4]:
-                state["all_blocks"].remove(block)
-                state[current_player.name]["block_pawn_pos"].pop(block_id)
+            if destination in topology.safe_positions:
+                self._remove_block(journal, state, block)
+                self._pop_block(journal, state, block_pawn_pos, block)
                 for p in block.pawns:
-                    state[current_player.name]["single_pawn_pos"][p.id] = destination
+                    self._set_single(journal, state, single_pawn_pos, p.id, destination)
             # Elif destination is an intermediate star, make the block not rigid
-            elif destination in self.stars[4:]:
-                block.rigid = False
+            elif destination in topology.inner_stars:
+                block = self._set_rigid(journal, state, block_pawn_pos, block, False)
             # Else, remove the single pawns of the block because the block will be rigid
             else:
-                block.rigid = True
+                block = self._set_rigid(journal, state, block_pawn_pos, block, True)
                 for p in block.pawns:
-                    try:
-                        state[current_player.name]["single_pawn_pos"].pop(p.id)
-                    except:
-                        # Ignore if block is already rigid
-                        pass
+                    # Ignore if block is already rigid
+                    if p.id in single_pawn_pos:
+                        self._pop_single(journal, state, single_pawn_pos, p.id)
 
             # If destination is finale and not all other pawns in finale position, give two more move
-            if destination in self.finale_positions and len(
-                    [pos for pawn_id, pos in state[current_player.name]["single_pawn_pos"].items() if
-                     pos not in self.finale_positions] + [pos for pawn_id, pos in state[current_player.name]["block_pawn_pos"].items() if
-                     pos not in self.finale_positions]) > 0:
+            if destination in topology.finale_positions and len(
+                    [pos for pawn_id, pos in single_pawn_pos.items() if
+                     pos not in topology.finale_positions] + [pos for pawn_id, pos in block_pawn_pos.items() if
+                     pos not in topology.finale_positions]) > 0:
                 num_more_moves += 2
 
-        return state, num_more_moves
+        return num_more_moves
+
+    def undo_move(self, state, journal):
+        """Reverts all the changes recorded in the journal by apply_move() or move_pawn() on the state"""
+        for entry in reversed(journal):
+            op = entry[0]
+            if op == _SET:
+                entry[1][entry[2]] = entry[3]
+            elif op == _ADD:
+                del entry[1][entry[2]]
+            elif op == _POP:
+                _, d, key, value, index = entry
+                items = list(d.items())
+                items.insert(index, (key, value))
+                d.clear()
+                d.update(items)
+            elif op == _APPEND:
+                entry[1].pop()
+            else:
+                entry[1].insert(entry[2], entry[3])
+        journal.clear()
 
     def check_available_moves(self, state, colour, player):
         if self.check_block_no_moves_player(state, self.config.players.index(player)):
@@ -409,7 +834,7 @@ class LudoModel:
 
         for pawn in self.pawns[colour]:
             try:
-                if state[player.name]["single_pawn_pos"][pawn.id] not in self.finale_positions:
+                if state[player.name]["single_pawn_pos"][pawn.id] not in self.topology.finale_positions:
                     return True
             except:
                 # If pawn is blocked with other, that means the game is not over for the player
@@ -418,120 +843,283 @@ class LudoModel:
 
 
     def generate_next_state(self, state, move):
-        state = deepcopy(state)
+        copy = self.path_copy if self.persistent else deepcopy
+        key = None
+        if self.transposition_table is not None and "hash" in state:
+            key = ("next", state["hash"], str(move))
+            next_state = self.transposition_table.get(key)
+            if next_state is not None:
+                # Only dice_roll and last_move_id are not covered by the hash
+                next_state = copy(next_state)
+                next_state["dice_roll"] = list(state["dice_roll"])
+                next_state["last_move_id"] = state["last_move_id"] + 1
+                return next_state
+        state = copy(state)
+        if self.persistent:
+            self.apply_move(state, move, record=False, shared={player.name for player in self.config.players})
+        else:
+            self.apply_move(state, move, record=False)
+        if key is not None:
+            self.transposition_table.put(key, copy(state))
+        return state
+
+    def path_copy(self, state):
+        """Returns a copy of the state which shares the positions of all players with the state. Only the top level and the small containers which
+        every move changes are copied. The positions are copied by move_pawn() when a move changes them."""
+        next_state = dict(state)
+        next_state["dice_roll"] = list(state["dice_roll"])
+        next_state["all_blocks"] = list(state["all_blocks"])
+        for key in ("pawn_blocks", "finished", "stuck"):
+            if key in state:
+                next_state[key] = dict(state[key])
+        return next_state
+
+    def apply_move(self, state, move, record=True, shared=None):
+        """Takes the move on the state in place (see generate_next_state()). Returns the journal of changes which can be given to undo_move() to get back the
+        original state (None if record is False). shared is passed on to move_pawn()."""
+        journal = [] if record else None
+        if "hash" in state:
+            self._set(journal, state, "hash", state["hash"])
         if move != [[]]:
             total_moves = state["num_more_moves"]
             for m, r in zip(move, state["dice_roll"]):
-                state, num_more_moves = self.__generate_next_state(state, r, m[1], m[0])
-                total_moves += num_more_moves
-            state["num_more_moves"] = total_moves
+                total_moves += self.move_pawn(state, r, m[1], m[0], journal, shared)
+            self._set_turn(journal, state, "num_more_moves", total_moves)
         # Update last move_id
-        state["last_move_id"] += 1
+        self._set(journal, state, "last_move_id", state["last_move_id"] + 1)
         # Change the turn
         if state["num_more_moves"] == 0:
-            state["current_player"] = (state["current_player"] + 1) % len(self.config.players)
+            self._set_turn(journal, state, "current_player", (state["current_player"] + 1) % len(self.config.players))
         # Check game over or not by evaluating if all other players have completed
         game_over = True
-        for colour, player in self.config.colour_player.items():
-            if player != self.config.players[state["current_player"]]:
-                if self.check_available_moves(state, colour, player):
-                    game_over = False
+        for player_index in range(len(self.config.players)):
+            if player_index != state["current_player"] and self.player_has_moves(state, player_index):
+                game_over = False
+                break
 
-        state["game_over"] = game_over
+        self._set(journal, state, "game_over", game_over)
         if state["num_more_moves"] > 0:
-            state["num_more_moves"] -= 1
-        return state
+            self._set_turn(journal, state, "num_more_moves", state["num_more_moves"] - 1)
+        return journal
 
     def check_block_no_moves_player(self, state, player_index):
         # Checks whether a heterogeneous block is present at the top of the home stretch from which a player cannot take any move
         player = self.config.players[player_index]
-        blocked = {LudoModel.RED: "P52", LudoModel.BLUE: "P39", LudoModel.GREEN: "P13", LudoModel.YELLOW: "P26"}
+        if "stuck" in state:
+            return state["stuck"][player.name] > 0
         for colour in player.colours:
             for pawn in self.pawns[colour]:
                 for block in state["all_blocks"]:
                     # If a block of the particular pawn is found, it is heterogeneous and rigid and in top of home stretch, then the player will have no moves
-                    if (pawn in block.pawns) and block.rigid and (block.pawns[0].id[0] != block.pawns[1].id[0]) and state[player.name]["block_pawn_pos"][block.id] == blocked[colour]:
+                    if (pawn in block.pawns) and block.rigid and (block.pawns[0].id[0] != block.pawns[1].id[0]) and state[player.name]["block_pawn_pos"][block.id] == self.blocked[colour]:
                         return True
         return False
 
     def generate_and_validate_moves(self, state, roll, selected_pawns):
-        state = deepcopy(state)
-        valid_moves = []
-        if len(roll) > 0:
-            # find out all possible movable pawns
-            next_possible_pawns = self.find_next_possible_pawns(state)
-            # Validate whether moving that pawn is possible or not for roll[0]
-            next_possible_pawns = next_possible_pawns["single_pawns"] + next_possible_pawns["block_pawns"]
+        return self._generate_and_validate_moves(deepcopy(state), roll, selected_pawns)
+
+    def _generate_and_validate_moves(self, state, roll, selected_pawns):
+        # Works on the given state in place. Every pawn movement is undone before trying the next one so the state is left unchanged.
+        return list(self._iter_moves(state, roll, selected_pawns))
+
+    def _iter_moves(self, state, roll, selected_pawns):
+        # Recursively moves a pawn for roll[0] and yields the moves of roll[1:] from there. Works on the given state in place and leaves it unchanged once
+        # exhausted. A pawn movement which finishes all pawns of the player makes it the only move of its level, so the level is scanned for such a
+        # movement before anything is yielded (only if the player is close enough to the finish for it to happen).
+        if len(roll) == 0:
+            yield selected_pawns
+            return
+        next_possible_pawns = self.find_next_possible_pawns(state)
+        next_possible_pawns = next_possible_pawns["single_pawns"] + next_possible_pawns["block_pawns"]
+        journal = []
+        player_index = state["current_player"]
+        if "finished" not in state or state["finished"][self.config.players[player_index].name] >= self.player_num_pawns[player_index] - 2:
             for pawn, current_pos in next_possible_pawns:
                 valid, destination_pos = self.validate_pawn_move(state, roll[0], current_pos, pawn)
-                # If valid move, generate new state by moving pawn and recursively find out next valid pawn movements for roll[1:]
                 if valid:
-                    sp = deepcopy(selected_pawns)
-                    sp.append([pawn, current_pos, destination_pos])
-                    next_state = self.__generate_next_state(state, roll[0], current_pos, pawn)[0]
-
-                    # If all pawns of the player are in finale positions, send back selected pawns
-                    try:
-                        pawns = []
-                        for colour in self.config.player_colour[next_state["current_player"]]:
-                            pawns = pawns + self.pawns[colour]
-                        for pawn in pawns:
-                            if next_state[self.config.players[next_state["current_player"]].name]["single_pawn_pos"][pawn.id] not in self.finale_positions:
-                                break
-                        else:
-                            return [sp]
-                    except:
-                        # If any error comes up, it means not all pawns are in finale positions
-                        pass
-
-                    for moves in self.generate_and_validate_moves(next_state, roll[1:], sp):
-                        valid_moves.append(moves)
-            return valid_moves
-        else:
-            return [selected_pawns]
+                    self.move_pawn(state, roll[0], current_pos, pawn, journal)
+                    won = self.check_all_pawns_in_finale(state, player_index)
+                    self.undo_move(state, journal)
+                    if won:
+                        yield selected_pawns + [[pawn, current_pos, destination_pos]]
+                        return
+        for pawn, current_pos in next_possible_pawns:
+            valid, destination_pos = self.validate_pawn_move(state, roll[0], current_pos, pawn)
+            if valid:
+                self.move_pawn(state, roll[0], current_pos, pawn, journal)
+                try:
+                    yield from self._iter_moves(state, roll[1:], selected_pawns + [[pawn, current_pos, destination_pos]])
+                finally:
+                    self.undo_move(state, journal)
+
+    def iter_moves(self, state, roll, with_states=False):
+        """Yields the moves of the roll one at a time in the same order as possible_moves() without building the whole list. If with_states is True,
+        (move, next state) pairs are yielded and the next state of a move is only generated when it is reached. Stopping early costs only the moves
+        generated so far."""
+        if not roll or roll == [6, 6, 6]:
+            return
+        moves = None
+        if self.move_cache is not None and "hash" in state:
+            moves = self.move_cache.get((state["hash"], tuple(roll)))
+        if moves is None:
+            moves = self._iter_moves(deepcopy(state), roll, [])
+        if with_states:
+            state = dict(state)
+            state["dice_roll"] = roll
+        for move in moves:
+            yield (move, self.generate_next_state(state, move)) if with_states else move
+
+    def has_legal_move(self, state, roll):
+        """Whether the roll has any move other than the pass move. Stops at the first move found."""
+        return next(self.iter_moves(state, roll), None) is not None
+
+    def count_moves(self, state, roll):
+        """Returns the number of moves of the roll without keeping them"""
+        return sum(1 for _ in self.iter_moves(state, roll))
+
+    def is_legal_move(self, state, roll, move):
+        """Whether the move is one of the moves of the roll (the pass move [[]] is legal only if there is no other move). The order of the pawns of a block
+        does not matter. Stops at the first matching move."""
+        def normalize(m):
+            return [(tuple(sorted(step[0])) if isinstance(step[0], (list, tuple)) else step[0],) + tuple(step[1:]) for step in m if step]
+        if not normalize(move):
+            return not self.has_legal_move(state, roll)
+        move = normalize(move)
+        return any(normalize(legal_move) == move for legal_move in self.iter_moves(state, roll))
+
+    def check_all_pawns_in_finale(self, state, player_index):
+        player = self.config.players[player_index]
+        if "finished" in state:
+            return state["finished"][player.name] == self.player_num_pawns[player_index]
+        for colour in player.colours:
+            for pawn in self.pawns[colour]:
+                if state[player.name]["single_pawn_pos"].get(pawn.id) not in self.topology.finale_positions:
+                    return False
+        return True
 
     def all_possible_moves(self, state):
         # Calculates all possible moves by a player before dice roll
+        if self.transposition_table is not None and "hash" in state:
+            key = ("moves", state["hash"])
+            possible_moves = self.transposition_table.get(key)
+            if possible_moves is None:
+                possible_moves = self._all_possible_moves(state)
+                self.transposition_table.put(key, possible_moves)
+            return possible_moves
+        return self._all_possible_moves(state)
+
+    def _all_possible_moves(self, state):
         state = deepcopy(state)
-        possible_rolls = [[i] for i in range(1, 6)] + [[6, i] for i in range(1, 6)] + [[6, 6, i] for i in range(1, 6)]
 
         # possible_moves = [{"roll": [throw1, throw2,...], "moves": [[[Pawn1, Current Position, Destination Position], [Pawn2, Current Position, Destination Position], [[Pawn3, Pawn4], Current Position, Desctination Position] ...], ... ]}, ...]
         possible_moves = []
-        for roll in possible_rolls:
-            validated_moves = self.generate_and_validate_moves(state, roll, [])
+        for roll in POSSIBLE_ROLLS[:-1]:
+            validated_moves = self._generate_and_validate_moves(state, roll, [])
             possible_moves.append({"roll": roll, "moves": validated_moves})
         possible_moves.append({"roll": [6,6,6], "moves": []})
         return possible_moves
 
+    def possible_moves(self, state, roll):
+        # Calculates the possible moves of a single roll (no moves if the dice is yet to be rolled)
+        if not roll or roll == [6, 6, 6]:
+            return []
+        if self.move_cache is None or "hash" not in state:
+            return self.generate_and_validate_moves(state, roll, [])
+        key = (state["hash"], tuple(roll))
+        moves = self.move_cache.get(key)
+        if moves is None:
+            moves = self.generate_and_validate_moves(state, roll, [])
+            self.move_cache.put(key, moves)
+        return moves
+
+    def distinct_moves(self, state, roll):
+        """Returns (moves, multiplicities) of the roll: the moves of possible_moves() where all moves whose next states are symmetric (same canonicalize()
+        result) are collapsed into the first of them, and the number of moves every returned move stands for. Cached in move_cache like possible_moves()."""
+        moves = self.possible_moves(state, roll)
+        if len(moves) < 2:
+            return moves, [1] * len(moves)
+        key = None
+        if self.move_cache is not None and "hash" in state:
+            key = (state["hash"], tuple(roll), "distinct")
+            distinct = self.move_cache.get(key)
+            if distinct is not None:
+                return distinct
+        state = deepcopy(state)
+        state["dice_roll"] = roll
+        # seen: canonical hash -> [[index of the representative, canonical record of its next state (computed on the first hash hit)]]
+        representatives, multiplicities, seen = [], [], {}
+        for move in moves:
+            journal = self.apply_move(state, move)
+            next_hash = self.canonical_hash(state)
+            candidates = seen.get(next_hash, [])
+            # Canonical states are only compared on a hash hit, a hash collision must not drop a move
+            record = self._canonical_record(state) if candidates else None
+            self.undo_move(state, journal)
+            match = None
+            for candidate in candidates:
+                if candidate[1] is None:
+                    journal = self.apply_move(state, representatives[candidate[0]])
+                    candidate[1] = self._canonical_record(state)
+                    self.undo_move(state, journal)
+                if candidate[1] == record:
+                    match = candidate[0]
+                    break
+            if match is not None:
+                multiplicities[match] += 1
+            else:
+                seen.setdefault(next_hash, []).append([len(representatives), record])
+                representatives.append(move)
+                multiplicities.append(1)
+        distinct = representatives, multiplicities
+        if key is not None:
+            self.move_cache.put(key, distinct)
+        return distinct
+
+    def _canonical_record(self, state):
+        # The canonical state as bytes (see LudoCodec), equal for all symmetric states
+        return self.codec.encode_states([self.canonicalize(state)[0]]).tobytes()
+
     def state_to_repr(self, state):
         """ The state representation: [R1, R2, R3, R4, G1, G2, G3, G4, Y1, Y2, Y3, Y4, B1, B2, B3, B4, RPlayer, GPlayer, YPlayer, BPlayer, current]"""
-
-        representation = np.zeros(shape=(59, 21), dtype=np.float32)
-        colour_pawn_index = {"R": -1, "G": 3, "Y": 7, "B": 11}
-        pawn_pos_index = {"B": -1, "P": 0, "H": 52}
-        colour_player_index = {LudoModel.RED: 16, LudoModel.GREEN: 17, LudoModel.YELLOW: 18, LudoModel.BLUE: 19}
-        for player_idx, (colours, player) in enumerate(zip(self.config.player_colour, self.config.players)):
-
-            # Setting RPlayer, GPlayer, YPlayer, BPlayer
-            for colour in colours:
-                representation[:, colour_player_index[colour]] = player_idx + 1
-
-            # Setting Single Pawns
-            for (pawn_id, pos) in state[player.name]["single_pawn_pos"].items():
-                colour_idx = colour_pawn_index[pawn_id[0]] + int(pawn_id[-1])
-                p, num = (pos[0], int(pos[1:])) if pos[0] == "P" else (pos[1], int(pos[2:])) if pos[1] == "H" else (pos[1], 1)
-                pos_idx = pawn_pos_index[p] + num
-                representation[pos_idx, colour_idx] = 1
-
-            # Setting Block Pawns
-            for (block_pawn_id, pos) in state[player.name]["block_pawn_pos"].items():
-                p, num = (pos[0], int(pos[1:])) if pos[0] == "P" else (pos[1], int(pos[2:]))
-                pos_idx = pawn_pos_index[p] + num
-                for pawn in self.fetch_block_from_id(state, block_pawn_id).pawns:
-                    pawn_id = pawn.id
-                    colour_idx = colour_pawn_index[pawn_id[0]] + int(pawn_id[-1])
-                    representation[pos_idx, colour_idx] = 1
-        representation[:, 20] = state["current_player"] + 1
+        return self.states_to_repr_batch([state])[0]
+
+    def states_to_repr_batch(self, states, out=None):
+        """ Batched version of state_to_repr. The position of every pawn is converted to (state index, row, column) and all of them are scattered
+        into a single (N, 59, 21) array with one numpy assignment."""
+        n = len(states)
+        if out is None:
+            representation = np.zeros(shape=(n, 59, 21), dtype=np.float32)
+        else:
+            representation = out[:n]
+            representation.fill(0)
+
+        state_idx, rows, cols = [], [], []
+        current_players = []
+        for i, state in enumerate(states):
+            blocks = None
+            for player in self.config.players:
+                # Setting Single Pawns
+                for pawn_id, pos in state[player.name]["single_pawn_pos"].items():
+                    state_idx.append(i)
+                    rows.append(self.repr_rows[pos])
+                    cols.append(self.repr_cols[pawn_id])
+                # Setting Block Pawns
+                block_pawn_pos = state[player.name]["block_pawn_pos"]
+                if block_pawn_pos:
+                    if blocks is None:
+                        blocks = {block.id: block for block in state["all_blocks"]}
+                    for block_id, pos in block_pawn_pos.items():
+                        for pawn in blocks[block_id].pawns:
+                            state_idx.append(i)
+                            rows.append(self.repr_rows[pos])
+                            cols.append(self.repr_cols[pawn.id])
+            current_players.append(state["current_player"] + 1)
+        representation[state_idx, rows, cols] = 1
+
+        # Setting RPlayer, GPlayer, YPlayer, BPlayer and current player
+        for col, value in self.repr_player_cols:
+            representation[:, :, col] = value
+        representation[:, :, 20] = np.array(current_players, dtype=np.float32)[:, None]
         return representation
 
     def get_state_jsonable(self, state):
@@ -560,6 +1148,319 @@ class LudoModel:
         return new_state
 
 
+class StateTransform:
+    """ A symmetry of the board which maps a state to its canonical state (see LudoModel.canonicalize()): a rotation of the board by whole colours followed
+    by a renumbering of the pawns of every colour. A pawn in the base is always on the base position of its own number.
+        Attributes:
+            - rotation: Number of colours the board is rotated by
+            - pawn_map: {pawn id: pawn id in the canonical state}
+        Methods:
+            - move(move): Maps a move of the original state to the same move of the canonical state
+            - inverse_move(move): Maps a move of the canonical state back to the original state
+    """
+
+    def __init__(self, model, rotation, pawn_map):
+        self.model = model
+        self.rotation = rotation
+        self.pawn_map = pawn_map
+        self.inverse_pawn_map = {canonical: pawn for pawn, canonical in pawn_map.items()}
+
+    def _map_move(self, move, pawn_map, positions):
+        mapped = []
+        for step in move:
+            if not step:
+                mapped.append(step)
+                continue
+            pawn, current_pos, destination = step
+            pawn = pawn_map[pawn] if isinstance(pawn, str) else [pawn_map[pawn_id] for pawn_id in pawn]
+            if current_pos[1] == "B":
+                # Base positions belong to the pawn
+                current_pos = self.model.bases[self.model.get_colour_from_id(pawn)][int(pawn[1:]) - 1]
+            else:
+                current_pos = positions[current_pos]
+            mapped.append([pawn, current_pos, positions[destination]])
+        return mapped
+
+    def move(self, move):
+        return self._map_move(move, self.pawn_map, self.model.rotated_positions[self.rotation])
+
+    def inverse_move(self, move):
+        return self._map_move(move, self.inverse_pawn_map, self.model.rotated_positions[(4 - self.rotation) % 4])
+
+
+class LazyMoves(Sequence):
+    """ A read only view of LudoModel.all_possible_moves(state) which generates the moves of a roll only when it is accessed (through
+    LudoModel.possible_moves(), so generated moves are cached by the model).
+        Methods:
+            - moves(roll): Returns the moves of the roll
+            - view[i]: Returns {"roll": roll, "moves": moves} of the i-th roll of POSSIBLE_ROLLS
+    """
+
+    def __init__(self, model, state):
+        self.model = model
+        self.state = state
+
+    def moves(self, roll):
+        return self.model.possible_moves(self.state, roll)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(POSSIBLE_ROLLS))[i]]
+        roll = POSSIBLE_ROLLS[i]
+        return {"roll": roll, "moves": self.moves(roll)}
+
+    def __len__(self):
+        return len(POSSIBLE_ROLLS)
+
+
+class LudoCodec:
+    """ This class packs states, moves and whole games into small versioned binary records so that they can cross process boundaries and be stored cheaply.
+    It is supposed to be used as LudoModel.codec. Every encoded state, move and game starts with the CODEC_VERSION byte.
+        Layout:
+            - state: STATE_RECORD (42 bytes). Pawns are in the order [R1, ..., R4, G1, ..., G4, Y1, ..., Y4, B1, ..., B4] and positions are square numbers of
+                    BoardTopology.squares (0 if the pawn is not part of the game). A blocked pawn stores the position of its block and the index + 1 of the other
+                    pawn of the block in "block" (BLOCK_RIGID bit set if the block is rigid).
+            - move: number of steps (0 for the pass move [[]], NO_MOVE for the empty move [] of the last state of a game) followed by 4 bytes for every step:
+                    pawn index + 1, index + 1 of the other pawn of a block (0 for a single pawn), current square and destination square
+            - game: GAME_HEADER (version, number of players, winner index or NO_WINNER, number of states), the colour indices of every player (count followed
+                    by the indices), the STATE_RECORD of every state, the MOVE_RECORD of the move taken from every state, the number of top moves of every state
+                    and all TOP_MOVE_RECORDs
+        Methods:
+            - encode_state(state) / decode_state(data): Single state. Decoded states are prepared (see LudoModel.prepare_state()).
+            - encode_move(move) / decode_move(data): Single move
+            - encode_states(states) / decode_states(records): List of states to and from an array of STATE_RECORD
+            - encode_moves(moves) / decode_moves(records): List of moves to and from an array of MOVE_RECORD
+            - records_to_repr(records, out=None): Same as LudoModel.states_to_repr_batch but directly from an array of STATE_RECORD (fully vectorized)
+            - encode_game(states, moves, winner=None, top_moves=None): Encodes a whole game. moves[i] is the move taken from states[i] (the moves of the last
+                    states may be left out) and top_moves[i] is the list of {"move": move, "prob": probability, "value": value} logged for states[i].
+            - LudoCodec.read_game(data): Returns {"player_colour", "winner", "states", "moves", "top_moves"} of an encoded game. states and moves are record
+                    arrays which share the memory of data.
+            - LudoCodec.game_to_log(data): Converts an encoded game to the jsonable log format used by the visualizer
+            - LudoCodec.for_config(player_colour): Returns the (cached) codec of a colour configuration
+    """
+
+    COLOURS = [LudoModel.RED, LudoModel.GREEN, LudoModel.YELLOW, LudoModel.BLUE]
+    _codecs = {}
+
+    def __init__(self, model):
+        self.model = model
+        squares = model.topology.squares
+        self.squares = squares
+        self.square_index = model.topology.square_index
+        self.pawn_ids = list(model.repr_cols)
+        self.pawn_index = {pawn_id: i for i, pawn_id in enumerate(self.pawn_ids)}
+        # Pawn indices of every player in the order used by Ludo.reset()
+        self.player_pawns = [[self.pawn_index[pawn.id] for colour in colours for pawn in model.pawns[colour]] for colours in model.config.player_colour]
+        self.pawn_player = {i: player_idx for player_idx, pawns in enumerate(self.player_pawns) for i in pawns}
+        self.repr_rows = np.array([model.repr_rows.get(pos, 0) for pos in squares], dtype=np.intp)
+
+    @classmethod
+    def for_config(cls, player_colour):
+        key = tuple(tuple(colours) for colours in player_colour)
+        codec = cls._codecs.get(key)
+        if codec is None:
+            codec = cls._codecs[key] = LudoModel(GameConfig([list(colours) for colours in key])).codec
+        return codec
+
+    # ============= States =======================
+
+    def _pack_state(self, state, buffer, offset):
+        # Writes the STATE_RECORD of the state into buffer at offset
+        roll = state["dice_roll"]
+        _STATE_HEADER.pack_into(buffer, offset, state["game_over"], state["current_player"], state["num_more_moves"], *(list(roll) + [0] * (3 - len(roll))),
+                                state["last_move_id"])
+        pos = offset + _STATE_HEADER.size
+        block = pos + len(self.pawn_ids)
+        pawn_index, square_index = self.pawn_index, self.square_index
+        for player in self.model.config.players:
+            for pawn_id, p in state[player.name]["single_pawn_pos"].items():
+                buffer[pos + pawn_index[pawn_id]] = square_index[p]
+            for block_id, p in state[player.name]["block_pawn_pos"].items():
+                pawn_block = self.model.fetch_block_from_id(state, block_id)
+                i, j = pawn_index[pawn_block.pawns[0].id], pawn_index[pawn_block.pawns[1].id]
+                rigid = BLOCK_RIGID if pawn_block.rigid else 0
+                buffer[pos + i] = buffer[pos + j] = square_index[p]
+                buffer[block + i] = (j + 1) | rigid
+                buffer[block + j] = (i + 1) | rigid
+
+    def encode_states(self, states):
+        buffer = bytearray(len(states) * STATE_RECORD.itemsize)
+        for i, state in enumerate(states):
+            self._pack_state(state, buffer, i * STATE_RECORD.itemsize)
+        return np.frombuffer(buffer, dtype=STATE_RECORD)
+
+    def decode_states(self, records):
+        model = self.model
+        players = model.config.players
+        data = records.tobytes()
+        states = []
+        for offset in range(0, len(data), STATE_RECORD.itemsize):
+            game_over, current_player, num_more_moves, throw1, throw2, throw3, last_move_id = _STATE_HEADER.unpack_from(data, offset)
+            pos = data[offset + _STATE_HEADER.size: offset + _STATE_HEADER.size + len(self.pawn_ids)]
+            block = data[offset + _STATE_HEADER.size + len(self.pawn_ids): offset + STATE_RECORD.itemsize]
+            state = {"game_over": bool(game_over), "current_player": current_player, "num_more_moves": num_more_moves,
+                     "dice_roll": [throw for throw in (throw1, throw2, throw3) if throw], "last_move_id": last_move_id}
+            all_blocks = []
+            for player, pawns in zip(players, self.player_pawns):
+                single_pawn_pos, block_pawn_pos = {}, {}
+                for i in pawns:
+                    other = (block[i] & ~BLOCK_RIGID) - 1
+                    if other < 0:
+                        single_pawn_pos[self.pawn_ids[i]] = self.squares[pos[i]]
+                    elif other > i:
+                        pawn_block = model.create_block([self.pawn_ids[i], self.pawn_ids[other]], bool(block[i] & BLOCK_RIGID))
+                        all_blocks.append(pawn_block)
+                        block_pawn_pos[pawn_block.id] = self.squares[pos[i]]
+                state[player.name] = {"single_pawn_pos": single_pawn_pos, "block_pawn_pos": block_pawn_pos}
+            state["all_blocks"] = all_blocks
+            states.append(model.prepare_state(state))
+        return states
+
+    def encode_state(self, state):
+        buffer = bytearray(1 + STATE_RECORD.itemsize)
+        buffer[0] = CODEC_VERSION
+        self._pack_state(state, buffer, 1)
+        return bytes(buffer)
+
+    def decode_state(self, data):
+        _check_version(data)
+        return self.decode_states(np.frombuffer(data, dtype=STATE_RECORD, count=1, offset=1))[0]
+
+    def records_to_repr(self, records, out=None):
+        """ Vectorized version of LudoModel.states_to_repr_batch for an array of STATE_RECORD. A pawn is in the game if its square is not 0 and its
+        row in the representation is looked up from its square."""
+        n = len(records)
+        if out is None:
+            representation = np.zeros(shape=(n, 59, 21), dtype=np.float32)
+        else:
+            representation = out[:n]
+            representation.fill(0)
+        pos = records["pos"]
+        state_idx, cols = np.nonzero(pos)
+        representation[state_idx, self.repr_rows[pos[state_idx, cols]], cols] = 1
+        for col, value in self.model.repr_player_cols:
+            representation[:, :, col] = value
+        representation[:, :, 20] = records["current_player"][:, None] + 1
+        return representation
+
+    # ============= Moves =======================
+
+    def _move_steps(self, move):
+        # Returns the (pawn, other pawn, current square, destination square) of every step of the move
+        if not move:
+            return None
+        steps = []
+        for step in move:
+            if step:
+                pawn, current_pos, destination = step
+                if isinstance(pawn, str):
+                    steps.append((self.pawn_index[pawn] + 1, 0, self.square_index[current_pos], self.square_index[destination]))
+                else:
+                    steps.append((self.pawn_index[pawn[0]] + 1, self.pawn_index[pawn[1]] + 1, self.square_index[current_pos],
+                                  self.square_index[destination]))
+        return steps
+
+    def _unpack_steps(self, num_steps, steps):
+        # Inverse of _move_steps. steps is a flat sequence of 4 bytes per step.
+        if num_steps == NO_MOVE:
+            return []
+        if num_steps == 0:
+            return [[]]
+        move = []
+        for k in range(0, 4 * num_steps, 4):
+            pawn, other, current_pos, destination = steps[k: k + 4]
+            pawn_id = self.pawn_ids[pawn - 1] if not other else [self.pawn_ids[pawn - 1], self.pawn_ids[other - 1]]
+            move.append([pawn_id, self.squares[current_pos], self.squares[destination]])
+        return move
+
+    def encode_move(self, move):
+        steps = self._move_steps(move)
+        if steps is None:
+            return bytes((CODEC_VERSION, NO_MOVE))
+        return bytes((CODEC_VERSION, len(steps)) + tuple(b for step in steps for b in step))
+
+    def decode_move(self, data):
+        _check_version(data)
+        return self._unpack_steps(data[1], data[2:])
+
+    def encode_moves(self, moves):
+        buffer = bytearray(len(moves) * MOVE_RECORD.itemsize)
+        for i, move in enumerate(moves):
+            steps = self._move_steps(move)
+            offset = i * MOVE_RECORD.itemsize
+            if steps is None:
+                buffer[offset] = NO_MOVE
+            else:
+                buffer[offset] = len(steps)
+                buffer[offset + 1: offset + 1 + 4 * len(steps)] = bytes(b for step in steps for b in step)
+        return np.frombuffer(buffer, dtype=MOVE_RECORD)
+
+    def decode_moves(self, records):
+        data = records.tobytes()
+        return [self._unpack_steps(data[offset], data[offset + 1: offset + MOVE_RECORD.itemsize]) for offset in
+                range(0, len(data), MOVE_RECORD.itemsize)]
+
+    # ============= Games =======================
+
+    def encode_game(self, states, moves, winner=None, top_moves=None):
+        num_states = len(states)
+        moves = list(moves) + [[]] * (num_states - len(moves))
+        top_moves = list(top_moves or []) + [[]] * (num_states - len(top_moves or []))
+        counts = np.array([len(t) for t in top_moves], dtype=np.uint8)
+        flat_top_moves = [t for state_top_moves in top_moves for t in state_top_moves]
+        top_records = np.zeros(len(flat_top_moves), dtype=TOP_MOVE_RECORD)
+        top_records["move"] = self.encode_moves([t["move"] for t in flat_top_moves])
+        top_records["prob"] = [t["prob"] for t in flat_top_moves]
+        top_records["value"] = [t.get("value", np.nan) for t in flat_top_moves]
+
+        player_colour = self.model.config.player_colour
+        header = _GAME_HEADER.pack(CODEC_VERSION, len(player_colour), NO_WINNER if winner is None else winner, num_states)
+        colours = bytes(b for colours in player_colour for b in [len(colours)] + [LudoCodec.COLOURS.index(colour) for colour in colours])
+        return b"".join((header, colours, self.encode_states(states).tobytes(), self.encode_moves(moves).tobytes(), counts.tobytes(),
+                         top_records.tobytes()))
+
+    @staticmethod
+    def read_game(data):
+        _check_version(data)
+        _, num_players, winner, num_states = _GAME_HEADER.unpack_from(data)
+        offset = _GAME_HEADER.size
+        player_colour = []
+        for _ in range(num_players):
+            count = data[offset]
+            player_colour.append([LudoCodec.COLOURS[c] for c in data[offset + 1: offset + 1 + count]])
+            offset += 1 + count
+        states = np.frombuffer(data, dtype=STATE_RECORD, count=num_states, offset=offset)
+        offset += states.nbytes
+        moves = np.frombuffer(data, dtype=MOVE_RECORD, count=num_states, offset=offset)
+        offset += moves.nbytes
+        counts = np.frombuffer(data, dtype=np.uint8, count=num_states, offset=offset)
+        offset += counts.nbytes
+        top_records = np.frombuffer(data, dtype=TOP_MOVE_RECORD, count=int(counts.sum()), offset=offset)
+        top_moves = np.split(top_records, np.cumsum(counts)[:-1]) if num_states else []
+        return {"player_colour": player_colour, "winner": None if winner == NO_WINNER else winner, "states": states, "moves": moves,
+                "top_moves": top_moves}
+
+    @staticmethod
+    def game_to_log(data):
+        game = LudoCodec.read_game(data)
+        codec = LudoCodec.for_config(game["player_colour"])
+        log = {"config": codec.model.config.get_dict(), "game": [],
+               "player_won": None if game["winner"] is None else game["winner"] + 1}
+        states = codec.decode_states(game["states"])
+        for state, move, top_records in zip(states, codec.decode_moves(game["moves"]), game["top_moves"]):
+            top_moves = []
+            for top_move, prob, value in zip(codec.decode_moves(top_records["move"]), top_records["prob"].tolist(), top_records["value"].tolist()):
+                top_moves.append({"move": top_move, "prob": prob} if value != value else {"move": top_move, "prob": prob, "value": value})
+            log["game"].append({"game_state": codec.model.get_state_jsonable(state), "move_id": state["last_move_id"], "move": move,
+                                "top_moves": top_moves})
+        return log
+
+
+def _check_version(data):
+    if not data or data[0] != CODEC_VERSION:
+        raise ValueError(f"Unsupported codec version {data[0] if data else None}, expected {CODEC_VERSION}")
+
+
 class Ludo:
     """ This is the actual game engine which stores the state of the game
      Attributes:
@@ -573,20 +1474,26 @@ class Ludo:
                     "last_move_id": 0, (What was the last move id: used to accept a new move based on last_move_id)
                     "player i": {"single_pawn_pos": {"pawn1": "position", ...}, "block_pawn_pos": {"blocked_pawn1": "position"}},
                     ...,
-                    "all_blocks": [] (all blocks that are currently present on the board)
+                    "all_blocks": [] (all blocks that are currently present on the board),
+                    "pawn_blocks": {"pawn1": PawnBlock, ...} (block of every blocked pawn, see LudoModel.prepare_state()),
+                    "finished": {"player i": 0, ...} (number of pawns of every player in finale positions),
+                    "stuck": {"player i": 0, ...} (number of rigid heterogeneous blocks of every player at a home stretch top),
+                    "hash": Zobrist hash of the state (see LudoModel.prepare_state())
                 }
         - all_current_moves: List of all possible moves corresponding to a particular roll. Described below:
                 all_current_moves = [{"roll": [throw1, throw2,...], "moves": [{"roll": [throw1, throw2,...], "moves": [[[Pawn1, Current Position, Destination Position], [Pawn2, Current Position, Destination Position], [[Pawn3, Pawn4], Current Position, Desctination Position] ...], ... ]}, ...]
+                It is a LazyMoves view, so the moves of a roll are only generated when they are accessed. Use all_current_moves.moves(roll) to get the moves of one roll.
 
     Methods:
-        - __init__(config): Constructor to create the engine with a GameConfig object. See doc string of GameConfig class
+        - __init__(config, persistent=False): Constructor to create the engine with a GameConfig object. See doc string of GameConfig class. persistent is
+                    passed on to LudoModel.
         - reset(): Resets the engine to produce a new game
         - turn(move, move_id): Takes a move. "move_id" is presented to ensure no move is taken twice.
 
     """
 
-    def __init__(self, config):
-        self.model = LudoModel(config)
+    def __init__(self, config, persistent=False):
+        self.model = LudoModel(config, persistent=persistent)
         self.reset()
 
     def reset(self):
@@ -604,36 +1511,26 @@ class Ludo:
                     pawns[pawn.id] = pos
             self.state[player.name] = {"single_pawn_pos": pawns, "block_pawn_pos": {}}
         self.state["all_blocks"] = []
+        self.model.prepare_state(self.state)
 
-        self.all_current_moves = self.model.all_possible_moves(self.state)
+        self.all_current_moves = LazyMoves(self.model, self.state)
 
     def turn(self, move, move_id):
         # Take the move and create next state
         if move_id == self.state["last_move_id"] + 1:
             self.state = self.model.generate_next_state(self.state, move)
 
-            # Find if any player who has completed his game. Make him the winner if the winner is not already set
+            # Find if any player who has completed his game. Make him the winner if the winner is not already set. If the game has ended but there
+            # are no winners declared yet, the current player is the winner since the other players have no moves left
             if not self.winner:
-                for player in self.model.config.players:
-                    not_finale = False
-                    for colour in player.colours:
-                        for pawn in self.model.pawns[colour]:
-                            try:
-                                if self.state[player.name]["single_pawn_pos"][pawn.id] not in self.model.finale_positions:
-                                    not_finale = True
-                            except:
-                                not_finale = True
-                    if not not_finale:
-                        self.winner = player
-                        break
-            # If the game has ended but there are no winners declared yet, set the current player as winner since the other players have no moves left
-            if not self.winner and self.state["game_over"]:
-                self.winner = self.model.config.players[self.state["current_player"]]
+                winner = self.model.get_winner(self.state)
+                if winner is not None:
+                    self.winner = self.model.config.players[winner]
 
 
             if not self.state["game_over"]:
-                # cache all possible next moves
-                self.all_current_moves = self.model.all_possible_moves(self.state)
+                # view of all possible next moves (generated on access)
+                self.all_current_moves = LazyMoves(self.model, self.state)
                 # Generate new dice roll
                 roll = self.model.generate_dice_roll()
 
@@ -0,0 +1,442 @@
+import numpy as np
+from ludo import LudoModel
+
+""" This file contains a compact, integer encoded version of the Ludo Engine. It follows the exact same rules as LudoModel
+but stores a state as a small fixed size bytearray instead of a nested dictionary so that it can be copied and hashed cheaply """
+
+# Pawn indices used by the compact state: [R1, R2, R3, R4, G1, G2, G3, G4, Y1, Y2, Y3, Y4, B1, B2, B3, B4]
+COLOURS = [LudoModel.RED, LudoModel.GREEN, LudoModel.YELLOW, LudoModel.BLUE]
+PAWN_IDS = [f"{colour[0].upper()}{i + 1}" for colour in COLOURS for i in range(4)]
+NUM_PAWNS = len(PAWN_IDS)
+
+# Square numbers stored in the compact state (the numbering of BoardTopology.squares):
+#   0: pawn is not part of the game
+#   1..52: main track P1..P52
+#   53..76: home stretches RH1..RH6, GH1..GH6, YH1..YH6, BH1..BH6
+#   77..92: bases RB1..RB4, GB1..GB4, YB1..YB4, BB1..BB4
+NOT_IN_GAME = 0
+HOME_START = 53
+BASE_START = 77
+NUM_SQUARES = 93
+
+# Layout of the compact state
+POS = 0  # 16 bytes: square of every pawn (a blocked pawn stores the square of its block)
+BLOCK = 16  # 16 bytes: index + 1 of the other pawn in the block, 0 if the pawn is not blocked
+RIGID = 32  # 16 bytes: 1 if the block of the pawn is rigid
+CURRENT_PLAYER = 48
+NUM_MORE_MOVES = 49
+GAME_OVER = 50
+DICE_ROLL = 51  # 3 bytes: the throws of the dice roll, 0 for unused throws
+LAST_MOVE_ID = 54  # 4 bytes: little endian last_move_id
+STATE_SIZE = 58
+
+
+class CompactLudoModel:
+    """ This class is a drop in replacement of LudoModel which works on compact states. The compact state is a bytearray of STATE_SIZE bytes laid out as described
+    at the top of this file. Moves are exactly in the same format as LudoModel so that both models can be used interchangeably.
+        Methods:
+            - from_dict(state): Converts a LudoModel state dictionary to a compact state
+            - to_dict(state): Converts a compact state to a prepared LudoModel state dictionary (see LudoModel.prepare_state())
+            - generate_next_state(state, move): Same as LudoModel.generate_next_state but for compact states
+            - all_possible_moves(state): Same as LudoModel.all_possible_moves but for compact states
+            - possible_moves(state, roll): Same as LudoModel.possible_moves but for compact states (without a move cache)
+            - state_to_repr(state): Same as LudoModel.state_to_repr but for compact states
+            - states_to_repr_batch(states, out=None): Same as LudoModel.states_to_repr_batch but for compact states
+            - stacked_to_repr(stacked, out=None): Same as states_to_repr_batch but for an (N, STATE_SIZE) array of stacked compact states
+            - get_state_jsonable(state): Same as LudoModel.get_state_jsonable but for compact states
+        Note: The order of the moves may differ from LudoModel since LudoModel follows the insertion order of the pawns in the state dictionary while this model
+        follows the pawn indices.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.model = LudoModel(config)
+        self.topology = self.model.topology
+        self.square_names = self.topology.squares
+        self.square_index = self.topology.square_index
+        self.pawn_index = {pawn_id: i for i, pawn_id in enumerate(PAWN_IDS)}
+
+        # Tracks of every colour as square numbers and the inverse index of every square in the track
+        self.tracks = [self.topology.track_squares[colour] for colour in COLOURS]
+        self.track_index = [self.topology.track_square_index[colour] for colour in COLOURS]
+        self.jump_masks = [self.topology.jump_masks[colour] for colour in COLOURS]
+        self.bases = [BASE_START + i for i in range(NUM_PAWNS)]
+        self.home_stars = {self.square_index[pos] for pos in self.topology.home_stars}
+        self.stars = {self.square_index[pos] for pos in self.topology.stars}
+        self.inner_stars = {self.square_index[pos] for pos in self.topology.inner_stars}
+        self.finale_positions = {self.square_index[pos] for pos in self.topology.finale_positions}
+        self.safe_positions = self.home_stars | self.finale_positions
+        self.blocked = {0: self.square_index["P52"], 1: self.square_index["P13"], 2: self.square_index["P26"],
+                        3: self.square_index["P39"]}
+
+        # The player which owns each pawn (-1 if the colour is not part of the game)
+        self.pawn_player = [-1] * NUM_PAWNS
+        for player_idx, colours in enumerate(self.config.player_colour):
+            for colour in colours:
+                c = COLOURS.index(colour)
+                for i in range(4 * c, 4 * c + 4):
+                    self.pawn_player[i] = player_idx
+        self.player_pawns = [[i for i in range(NUM_PAWNS) if self.pawn_player[i] == player_idx] for player_idx in
+                             range(len(self.config.players))]
+        # Row of the tensor representation for every square
+        self.repr_row = [0] * NUM_SQUARES
+        for square in range(1, 53):
+            self.repr_row[square] = square
+        for square in range(HOME_START, BASE_START):
+            self.repr_row[square] = 52 + (square - HOME_START) % 6 + 1
+        self.repr_row_array = np.array(self.repr_row, dtype=np.intp)
+        self.pawns_in_game = np.array([i for i in range(NUM_PAWNS) if self.pawn_player[i] >= 0], dtype=np.intp)
+        self.repr_player_cols = [(16 + COLOURS.index(colour), player_idx + 1) for player_idx, colours in
+                                 enumerate(self.config.player_colour) for colour in colours]
+
+    # ============= State accessors =======================
+
+    def get_last_move_id(self, state):
+        return int.from_bytes(state[LAST_MOVE_ID: LAST_MOVE_ID + 4], "little")
+
+    def set_last_move_id(self, state, last_move_id):
+        state[LAST_MOVE_ID: LAST_MOVE_ID + 4] = last_move_id.to_bytes(4, "little")
+
+    def get_dice_roll(self, state):
+        return [throw for throw in state[DICE_ROLL: DICE_ROLL + 3] if throw]
+
+    def set_dice_roll(self, state, roll):
+        state[DICE_ROLL: DICE_ROLL + 3] = bytes(list(roll) + [0] * (3 - len(roll)))
+
+    def get_block_id(self, pawn1, pawn2):
+        return f"BL{PAWN_IDS[pawn1]}{PAWN_IDS[pawn2]}"
+
+    # ============= Converters =======================
+
+    def new_state(self):
+        """Returns the initial compact state of a game with all pawns in their bases"""
+        state = bytearray(STATE_SIZE)
+        for player_pawns in self.player_pawns:
+            for i in player_pawns:
+                state[POS + i] = self.bases[i]
+        return state
+
+    def from_dict(self, state):
+        """Converts a LudoModel state dictionary to a compact state"""
+        compact = bytearray(STATE_SIZE)
+        for player in self.config.players:
+            for pawn_id, pos in state[player.name]["single_pawn_pos"].items():
+                compact[POS + self.pawn_index[pawn_id]] = self.square_index[pos]
+            for block_id, pos in state[player.name]["block_pawn_pos"].items():
+                block = self.model.fetch_block_from_id(state, block_id)
+                pawn1, pawn2 = [self.pawn_index[pawn.id] for pawn in block.pawns]
+                for i, j in ((pawn1, pawn2), (pawn2, pawn1)):
+                    compact[POS + i] = self.square_index[pos]
+                    compact[BLOCK + i] = j + 1
+                    compact[RIGID + i] = int(block.rigid)
+        compact[CURRENT_PLAYER] = state["current_player"]
+        compact[NUM_MORE_MOVES] = state["num_more_moves"]
+        compact[GAME_OVER] = int(state["game_over"])
+        self.set_dice_roll(compact, state["dice_roll"])
+        self.set_last_move_id(compact, state["last_move_id"])
+        return compact
+
+    def to_dict(self, state):
+        """Converts a compact state to a LudoModel state dictionary"""
+        new_state = {"game_over": bool(state[GAME_OVER]), "current_player": state[CURRENT_PLAYER],
+                     "num_more_moves": state[NUM_MORE_MOVES], "dice_roll": self.get_dice_roll(state),
+                     "last_move_id": self.get_last_move_id(state)}
+        all_blocks = []
+        for player_idx, player in enumerate(self.config.players):
+            single_pawn_pos, block_pawn_pos = {}, {}
+            for i in self.player_pawns[player_idx]:
+                if not state[BLOCK + i]:
+                    single_pawn_pos[PAWN_IDS[i]] = self.square_names[state[POS + i]]
+                elif i < state[BLOCK + i] - 1:
+                    j = state[BLOCK + i] - 1
+                    block = self.model.create_block([PAWN_IDS[i], PAWN_IDS[j]], bool(state[RIGID + i]))
+                    all_blocks.append(block)
+                    block_pawn_pos[block.id] = self.square_names[state[POS + i]]
+            new_state[player.name] = {"single_pawn_pos": single_pawn_pos, "block_pawn_pos": block_pawn_pos}
+        new_state["all_blocks"] = all_blocks
+        return self.model.prepare_state(new_state)
+
+    # ============= Game calculations =======================
+
+    def generate_dice_roll(self):
+        return self.model.generate_dice_roll()
+
+    def find_next_possible_pawns(self, state):
+        # Collect all next possible pawns as [pawn index or (pawn1 index, pawn2 index), current square]
+        player_pawns = self.player_pawns[state[CURRENT_PLAYER]]
+        singles = [i for i in player_pawns if not state[BLOCK + i]]
+        blocks = [i for i in player_pawns if state[BLOCK + i] and i < state[BLOCK + i] - 1]
+        # Single pawn forward
+        next_possible_pawns = [[i, state[POS + i]] for i in singles if state[POS + i] not in self.finale_positions]
+        # Block pawn forward unblocked after star or unrigid block
+        for i in blocks:
+            if state[POS + i] in self.stars or not state[RIGID + i]:
+                next_possible_pawns.append([i, state[POS + i]])
+                next_possible_pawns.append([state[BLOCK + i] - 1, state[POS + i]])
+        # Single pawn forward with block
+        for a in range(len(singles) - 1):
+            for b in range(a + 1, len(singles)):
+                if state[POS + singles[a]] == state[POS + singles[b]]:
+                    next_possible_pawns.append([(singles[a], singles[b]), state[POS + singles[a]]])
+        # Block pawn forward
+        for i in blocks:
+            next_possible_pawns.append([(i, state[BLOCK + i] - 1), state[POS + i]])
+        return next_possible_pawns
+
+    def blockade_mask(self, state):
+        # Square bitset of the blocks of all other players (see BoardTopology.jump_masks)
+        current_player = state[CURRENT_PLAYER]
+        mask = 0
+        for i in range(NUM_PAWNS):
+            if state[BLOCK + i] and self.pawn_player[i] != current_player:
+                mask |= 1 << state[POS + i]
+        return mask
+
+    def validate_pawn_move(self, state, roll, current_pos, pawn):
+        # Calculate whether the move is valid given the state configuration and return the new square of the pawns
+        player_pawns = self.player_pawns[state[CURRENT_PLAYER]]
+        # Single pawns:
+        if isinstance(pawn, int):
+            track = self.tracks[pawn // 4]
+            index = self.track_index[pawn // 4][current_pos]
+            # Pawns only go to it's track only on 6 roll.
+            if index < 0:
+                return (True, track[0]) if roll == 6 else (False, None)
+            # Pawns cannot jump beyond its track
+            if index + roll >= len(track):
+                return False, None
+            # Pawns cannot jump over other pawn blocks except pos is a home star
+            jump_mask = self.jump_masks[pawn // 4][index][roll]
+            if jump_mask and jump_mask & self.blockade_mask(state):
+                return False, None
+            # Pawns cannot move to a destination if the same player's one block and one single pawn is present except home star
+            destination = track[index + roll]
+            if destination not in self.home_stars:
+                own_block, own_single = False, False
+                for i in player_pawns:
+                    if state[POS + i] == destination:
+                        if state[BLOCK + i]:
+                            own_block = True
+                        else:
+                            own_single = True
+                if own_block and own_single:
+                    return False, None
+        # Block Pawns:
+        else:
+            # Move is possible only if roll%2 == 0
+            if roll % 2 != 0:
+                return False, None
+            pawn1, pawn2 = pawn
+            pawn1_track, pawn2_track = self.tracks[pawn1 // 4], self.tracks[pawn2 // 4]
+            pawn1_index = self.track_index[pawn1 // 4][current_pos]
+            pawn2_index = self.track_index[pawn2 // 4][current_pos]
+            # Block Pawns cannot jump beyond their track
+            if pawn1_index + roll // 2 >= len(pawn1_track) or pawn2_index + roll // 2 >= len(pawn2_track):
+                return False, None
+            # Move is possible only if both BlockPawns land at the same place after moving
+            if pawn1_track[pawn1_index + roll // 2] != pawn2_track[pawn2_index + roll // 2]:
+                return False, None
+            # Block Pawns cannot jump over other pawn blocks except pos is a home star
+            jump_mask = self.jump_masks[pawn1 // 4][pawn1_index][roll // 2]
+            if jump_mask and jump_mask & self.blockade_mask(state):
+                return False, None
+            # Block Pawns cannot move to a destination if the same player's another block is present
+            destination = pawn1_track[pawn1_index + roll // 2]
+            for i in player_pawns:
+                if state[BLOCK + i] and state[POS + i] == destination:
+                    return False, None
+        return True, destination
+
+    def all_pawns_in_finale(self, state, player_idx):
+        for i in self.player_pawns[player_idx]:
+            if state[BLOCK + i] or state[POS + i] not in self.finale_positions:
+                return False
+        return True
+
+    def set_block(self, state, pawn1, pawn2, rigid):
+        state[BLOCK + pawn1], state[BLOCK + pawn2] = pawn2 + 1, pawn1 + 1
+        state[RIGID + pawn1] = state[RIGID + pawn2] = rigid
+
+    def break_block(self, state, pawn1, pawn2):
+        state[BLOCK + pawn1] = state[BLOCK + pawn2] = 0
+        state[RIGID + pawn1] = state[RIGID + pawn2] = 0
+
+    def move_pawn(self, state, roll, current_pos, pawn):
+        """Moves a pawn (or a block) on the compact state in place and returns the number of extra moves earned"""
+        num_more_moves = 0
+        current_player = state[CURRENT_PLAYER]
+        player_pawns = self.player_pawns[current_player]
+        # If single pawn, find next position and update it.
+        if isinstance(pawn, int):
+            track = self.tracks[pawn // 4]
+            destination = track[self.track_index[pawn // 4][current_pos] + roll]
+            state[POS + pawn] = destination
+
+            # If pawn is in a block, dissolve the block, leave the other pawn in old position
+            if state[BLOCK + pawn]:
+                self.break_block(state, pawn, state[BLOCK + pawn] - 1)
+
+            # If at current position two pawns are present and current position is not home star, block them up (non-rigid)
+            if current_pos not in self.home_stars:
+                pawns_at_current = [i for i in player_pawns if not state[BLOCK + i] and state[POS + i] == current_pos]
+                if len(pawns_at_current) >= 2:
+                    self.set_block(state, pawns_at_current[0], pawns_at_current[1], 0)
+
+            # If another single pawn of other player is present at destination position (except stars), capture it by sending it back to its base
+            if destination not in self.stars:
+                captured_players = set()
+                for i in range(NUM_PAWNS):
+                    if state[POS + i] == destination and not state[BLOCK + i] and self.pawn_player[i] != current_player \
+                            and self.pawn_player[i] not in captured_players:
+                        captured_players.add(self.pawn_player[i])
+                        state[POS + i] = self.bases[i]
+                        num_more_moves += 1
+
+            # If another single pawn of same player is present at destination position, block it with other pawn by default except the home star positions and finale position
+            if destination not in self.safe_positions:
+                for i in player_pawns:
+                    if i != pawn and not state[BLOCK + i] and state[POS + i] == destination:
+                        self.set_block(state, min(i, pawn), max(i, pawn), 0)
+                        break
+
+            # If destination is finale and not all other pawns in finale position, give another move
+            if destination in self.finale_positions and not self.all_pawns_in_finale(state, current_player):
+                num_more_moves += 1
+
+        # If Block pawn, find next position and update it.
+        else:
+            pawn1, pawn2 = pawn
+            destination = self.tracks[pawn1 // 4][self.track_index[pawn1 // 4][current_pos] + roll // 2]
+            state[POS + pawn1] = state[POS + pawn2] = destination
+            if not state[BLOCK + pawn1]:
+                self.set_block(state, pawn1, pawn2, 0)
+
+            # If another Block pawn of other player is present at destination position (except stars), capture them by breaking the block and sending them back to their respective bases
+            if destination not in self.stars:
+                captured_players = set()
+                for i in range(NUM_PAWNS):
+                    if state[POS + i] == destination and state[BLOCK + i] and self.pawn_player[i] != current_player \
+                            and self.pawn_player[i] not in captured_players:
+                        captured_players.add(self.pawn_player[i])
+                        j = state[BLOCK + i] - 1
+                        self.break_block(state, i, j)
+                        state[POS + i], state[POS + j] = self.bases[i], self.bases[j]
+                        num_more_moves += 2
+
+            # If destination is home or finale position , break the block into single pawns
+            if destination in self.safe_positions:
+                self.break_block(state, pawn1, pawn2)
+            # Elif destination is an intermediate star, make the block not rigid
+            elif destination in self.inner_stars:
+                state[RIGID + pawn1] = state[RIGID + pawn2] = 0
+            # Else, the block will be rigid
+            else:
+                state[RIGID + pawn1] = state[RIGID + pawn2] = 1
+
+            # If destination is finale and not all other pawns in finale position, give two more move
+            if destination in self.finale_positions and not self.all_pawns_in_finale(state, current_player):
+                num_more_moves += 2
+
+        return num_more_moves
+
+    def check_block_no_moves_player(self, state, player_index):
+        # Checks whether a heterogeneous block is present at the top of the home stretch from which a player cannot take any move
+        for i in self.player_pawns[player_index]:
+            j = state[BLOCK + i] - 1
+            if j >= 0 and state[RIGID + i] and i // 4 != j // 4 and state[POS + i] == self.blocked[i // 4]:
+                return True
+        return False
+
+    def check_available_moves(self, state, player_index):
+        if self.check_block_no_moves_player(state, player_index):
+            return False
+        return not self.all_pawns_in_finale(state, player_index)
+
+    def generate_next_state(self, state, move):
+        state = bytearray(state)
+        if move != [[]]:
+            total_moves = state[NUM_MORE_MOVES]
+            for m, r in zip(move, self.get_dice_roll(state)):
+                pawn = self.pawn_index[m[0]] if isinstance(m[0], str) else tuple(self.pawn_index[p] for p in m[0])
+                total_moves += self.move_pawn(state, r, self.square_index[m[1]], pawn)
+            state[NUM_MORE_MOVES] = total_moves
+        # Update last move_id
+        self.set_last_move_id(state, self.get_last_move_id(state) + 1)
+        # Change the turn
+        if state[NUM_MORE_MOVES] == 0:
+            state[CURRENT_PLAYER] = (state[CURRENT_PLAYER] + 1) % len(self.config.players)
+        # Check game over or not by evaluating if all other players have completed
+        game_over = True
+        for player_idx in range(len(self.config.players)):
+            if player_idx != state[CURRENT_PLAYER] and self.check_available_moves(state, player_idx):
+                game_over = False
+        state[GAME_OVER] = int(game_over)
+        if state[NUM_MORE_MOVES] > 0:
+            state[NUM_MORE_MOVES] -= 1
+        return state
+
+    def generate_and_validate_moves(self, state, roll, selected_pawns):
+        valid_moves = []
+        if len(roll) > 0:
+            for pawn, current_pos in self.find_next_possible_pawns(state):
+                valid, destination_pos = self.validate_pawn_move(state, roll[0], current_pos, pawn)
+                # If valid move, generate new state by moving pawn and recursively find out next valid pawn movements for roll[1:]
+                if valid:
+                    pawn_ids = PAWN_IDS[pawn] if isinstance(pawn, int) else [PAWN_IDS[p] for p in pawn]
+                    sp = selected_pawns + [[pawn_ids, self.square_names[current_pos], self.square_names[destination_pos]]]
+                    next_state = bytearray(state)
+                    self.move_pawn(next_state, roll[0], current_pos, pawn)
+
+                    # If all pawns of the player are in finale positions, send back selected pawns
+                    if self.all_pawns_in_finale(next_state, next_state[CURRENT_PLAYER]):
+                        return [sp]
+
+                    valid_moves.extend(self.generate_and_validate_moves(next_state, roll[1:], sp))
+            return valid_moves
+        else:
+            return [selected_pawns]
+
+    def all_possible_moves(self, state):
+        # Calculates all possible moves by a player before dice roll
+        possible_rolls = [[i] for i in range(1, 6)] + [[6, i] for i in range(1, 6)] + [[6, 6, i] for i in range(1, 6)]
+        possible_moves = []
+        for roll in possible_rolls:
+            possible_moves.append({"roll": roll, "moves": self.generate_and_validate_moves(state, roll, [])})
+        possible_moves.append({"roll": [6, 6, 6], "moves": []})
+        return possible_moves
+
+    def possible_moves(self, state, roll):
+        # Calculates the possible moves of a single roll (no moves if the dice is yet to be rolled)
+        if not roll or roll == [6, 6, 6]:
+            return []
+        return self.generate_and_validate_moves(state, roll, [])
+
+    def state_to_repr(self, state):
+        """ The state representation: [R1, R2, R3, R4, G1, G2, G3, G4, Y1, Y2, Y3, Y4, B1, B2, B3, B4, RPlayer, GPlayer, YPlayer, BPlayer, current]"""
+        return self.states_to_repr_batch([state])[0]
+
+    def states_to_repr_batch(self, states, out=None):
+        """ Batched version of state_to_repr. The compact states are stacked into an (N, STATE_SIZE) array and the pawn squares are scattered into
+        the representation without touching the individual states."""
+        stacked = np.frombuffer(b"".join(states), dtype=np.uint8).reshape(len(states), STATE_SIZE)
+        return self.stacked_to_repr(stacked, out)
+
+    def stacked_to_repr(self, stacked, out=None):
+        """ Same as states_to_repr_batch but for compact states which are already stacked in an (N, STATE_SIZE) uint8 array"""
+        n = stacked.shape[0]
+        if out is None:
+            representation = np.zeros(shape=(n, 59, 21), dtype=np.float32)
+        else:
+            representation = out[:n]
+            representation.fill(0)
+        if n == 0:
+            return representation
+        rows = self.repr_row_array[stacked[:, POS: POS + NUM_PAWNS][:, self.pawns_in_game]]
+        representation[np.arange(n)[:, None], rows, self.pawns_in_game] = 1
+        for col, value in self.repr_player_cols:
+            representation[:, :, col] = value
+        representation[:, :, 20] = stacked[:, CURRENT_PLAYER, None] + 1
+        return representation
+
+    def get_state_jsonable(self, state):
+        return self.model.get_state_jsonable(self.to_dict(state))
@@ -1,11 +1,24 @@
-import base64
+import multiprocessing
+import queue
+import random
 import threading
 import time
 import traceback
+from itertools import accumulate
 from random import choices
 import numpy as np
-from copy import deepcopy
-import tensorflow as tf
+from ludo import LudoModel, GameConfig, POSSIBLE_ROLLS, ROLL_IDS, ROLL_PROBABILITIES, STATE_RECORD, MOVE_RECORD
+from perft import normalize_move
+
+ROLL_CUM_WEIGHTS = list(accumulate(ROLL_PROBABILITIES))
+
+
+# Guards the creation of children nodes (see MCTNode.get_child())
+_child_lock = threading.Lock()
+# Threads waiting for the expansion of a node wait on the condition of its stripe (see expansion_condition()), so nodes need no lock of their own. The
+# condition also guards the stats of the node: every update of N and W and the replacement of the arrays by expand_roll() hold it.
+NUM_EXPANSION_STRIPES = 64
+_expansion_conditions = [threading.Condition() for _ in range(NUM_EXPANSION_STRIPES)]
 
 
 class MCTNode:
@@ -16,71 +29,111 @@ class MCTNode:
             - players: List of player objects present in game_config
             - model: The model of the ludo game
             - parent: The reference to the parent node so that backup becomes easy
+        Rolls are identified by their index in POSSIBLE_ROLLS (roll id). The moves of a roll are the segment segments[roll_id] = [from_index, to_index)
+        of available_moves, children and the stats ([-1, -1] until the moves of the roll are generated). Segments are appended in the order in which
+        the rolls are expanded. The priors of a roll are placeholders till set_priors() is called for it; the rolls whose priors are set are kept as
+        a bitmask of roll ids for every player in evaluated.
             """
         self.state = state
         self.players = players
         self.model = model
         self.parent = parent
         self.available_moves = []
+        self.segments = None
+        self.roll_ids = []
+        self.roll_weights = []
         self.stats = {player.name: {} for player in self.players}
         self.children = []
+        self.evaluated = {}
         self.expanded = False  # By default, make the node expanded if game is over at this state
-        self.expansion_event = threading.Event()
-        self.expansion_event.set()
+        self.expanding = False  # Set while a thread expands the node or one of its rolls (see mcts_job())
 
     def expand(self):
-        """Expands the node and creates stats and children nodes. Returns all next states"""
-
-        # Generate all possible moves
-        valid_moves = []
-        if not self.state["game_over"]:
-            moves = self.model.all_possible_moves(self.state)
-            for d in moves:
-                if len(d["moves"]) > 0:
-                    for move in d["moves"]:
-                        valid_moves.append({"roll": d["roll"], "move": move})
-                else:
-                    valid_moves.append({"roll": d["roll"], "move": [[]]})
-        self.available_moves = valid_moves
+        """Expands the node: all rolls can be sampled at the node. Moves are only generated for a roll when it is sampled for the first time
+        (see expand_roll()) and children only when a move is selected for the first time (see get_child())."""
+        self.segments = np.full(shape=(len(POSSIBLE_ROLLS), 2), fill_value=-1, dtype=np.int32)
+        self.roll_ids = [] if self.state["game_over"] else list(range(len(POSSIBLE_ROLLS)))
+        self.roll_weights = list(accumulate(ROLL_PROBABILITIES[roll_id] for roll_id in self.roll_ids))
 
         # Initialize the statistics for each player
         for player in self.players:
-            self.stats[player.name] = {
-                "P": np.random.random(size=len(self.available_moves)),
-                "N": np.ones(shape=(len(self.available_moves),)),
-                "W": np.zeros(shape=(len(self.available_moves),))
-            }
-
-        # Generating next states
-        next_states = []
-        roll = self.state["dice_roll"]
-        for move in self.available_moves:
-            self.state["dice_roll"] = move["roll"]
-            next_states.append(self.model.generate_next_state(self.state, move["move"]))
+            self.stats[player.name] = {"P": np.zeros(shape=(0,)), "N": np.zeros(shape=(0,)), "W": np.zeros(shape=(0,))}
         self.expanded = True
-        self.state["dice_roll"] = roll
-
-        # Generating next nodes
-        self.children = [MCTNode(state, self.players, self.model, self) for state in next_states]
-
-        return next_states
-
-    def prune(self, from_index, to_index):
-        """Prunes the tree according to indices of moves.
-            Args:
-                - from_index (included): The index from which moves have to be kept
-                - to_index (excluded): The index to which moves have to be kept
-        """
-        # Prune moves and children
-        new_moves = []
-        new_children = []
-        for index, move in enumerate(self.available_moves):
-            if from_index <= index < to_index:
-                new_moves.append(move)
-                if self.expanded:
-                    new_children.append(self.children[index])
-        self.available_moves = new_moves
-        self.children = new_children
+
+    def expand_roll(self, roll_id):
+        """Generates the moves of the roll and appends them to the available moves. Their next states are not kept (see next_states()), the children
+        are created by get_child()."""
+        roll = POSSIBLE_ROLLS[roll_id]
+        # Moves whose next states are symmetric are expanded once, "multiplicity" is the number of moves it stands for
+        moves, multiplicities = self.model.distinct_moves(self.state, roll)
+        if len(moves) == 0:
+            moves, multiplicities = [[[]]], [1]
+        from_index = len(self.available_moves)
+        self.available_moves = self.available_moves + [{"roll": roll, "roll_id": roll_id, "move": move, "multiplicity": multiplicity} for
+                                                       move, multiplicity in zip(moves, multiplicities)]
+        with _child_lock:
+            self.children = self.children + [None] * len(moves)
+        # Other threads may update the stats of the node, the arrays are only replaced while no update is in progress
+        with expansion_condition(self):
+            for player in self.players:
+                stats = self.stats[player.name]
+                self.stats[player.name] = {"P": np.concatenate([stats["P"], np.random.random(size=len(moves))]),
+                                           "N": np.concatenate([stats["N"], np.ones(shape=(len(moves),))]),
+                                           "W": np.concatenate([stats["W"], np.zeros(shape=(len(moves),))])}
+        self.segments[roll_id] = from_index, len(self.available_moves)
+
+    def next_states(self, roll_id):
+        """Returns the next states of the moves of the roll (which have to be generated already)"""
+        from_index, to_index = self.segments[roll_id]
+        state = dict(self.state)
+        state["dice_roll"] = POSSIBLE_ROLLS[roll_id]
+        return [self.model.generate_next_state(state, move["move"]) for move in self.available_moves[from_index: to_index]]
+
+    def roll_expanded(self, roll_id):
+        return self.segments[roll_id, 0] >= 0
+
+    def roll_evaluated(self, player, roll_id):
+        """Whether the priors of the moves of the roll are set for the player"""
+        return bool(self.evaluated.get(player.name, 0) >> roll_id & 1)
+
+    def get_child(self, index):
+        """Returns the child node of the move at the index, creating it on its first use"""
+        child = self.children[index]
+        if child is None:
+            move = self.available_moves[index]
+            state = dict(self.state)
+            state["dice_roll"] = move["roll"]
+            child = MCTNode(self.model.generate_next_state(state, move["move"]), self.players, self.model, self)
+            # Another thread may have created the child in the meantime
+            with _child_lock:
+                if self.children[index] is None:
+                    self.children[index] = child
+                child = self.children[index]
+        return child
+
+    def sample_roll(self):
+        """Samples the id of a roll with the exact probability of the roll"""
+        return choices(self.roll_ids, cum_weights=self.roll_weights)[0]
+
+    def set_priors(self, player, roll_ids, result, prior_temp):
+        """Sets the priors of the moves of the rolls from the evaluation result of their next states (in the order of the moves) and returns the value of
+        the node: the values of the rolls weighted by their probabilities"""
+        priors, value = roll_priors(result, [self.segments[roll_id, 1] - self.segments[roll_id, 0] for roll_id in roll_ids], roll_ids, prior_temp)
+        for roll_id, p in zip(roll_ids, priors):
+            from_index, to_index = self.segments[roll_id]
+            self.stats[player.name]["P"][from_index: to_index] = p
+            self.evaluated[player.name] = self.evaluated.get(player.name, 0) | 1 << roll_id
+        return value
+
+    def prune(self, roll_id):
+        """Prunes the tree to the moves of the roll (which have to be generated already). Only the roll can be sampled at the node afterwards."""
+        from_index, to_index = self.segments[roll_id]
+        self.available_moves = self.available_moves[from_index: to_index]
+        self.children = self.children[from_index: to_index]
+        self.segments[:] = -1
+        self.segments[roll_id] = 0, to_index - from_index
+        self.roll_ids = [roll_id]
+        self.roll_weights = [ROLL_PROBABILITIES[roll_id]]
 
         # Prune stats of players
         for player in self.players:
@@ -89,6 +142,62 @@ class MCTNode:
             self.stats[player.name]["W"] = self.stats[player.name]["W"][from_index: to_index]
 
 
+def expansion_condition(node):
+    """Returns the condition of the stripe of the node which guards its expanding flag"""
+    # Object ids are multiples of 16
+    return _expansion_conditions[(id(node) >> 4) % NUM_EXPANSION_STRIPES]
+
+
+def wait_expansion(node):
+    """Waits while another thread is expanding the node"""
+    if node.expanding:
+        condition = expansion_condition(node)
+        with condition:
+            while node.expanding:
+                condition.wait()
+
+
+def end_expansion(node):
+    """Releases the node claimed for expansion and wakes up the threads waiting for it"""
+    condition = expansion_condition(node)
+    with condition:
+        node.expanding = False
+        condition.notify_all()
+
+
+def puct_select(p, n, w, c_puct):
+    """Returns the index of the move with the highest PUCT score among moves with the priors p, visit counts n and value sums w"""
+    u = c_puct * p * (np.sqrt(np.sum(n)) / (1.0 + n))
+    return int(np.argmax(w / n + u))
+
+
+def add_virtual_loss(n, w, index, n_vl):
+    n[index] += n_vl
+    w[index] -= n_vl
+
+
+def backup_edge(n, w, index, value, n_vl):
+    # Adds the value to the visited moves and removes their virtual losses
+    n[index] += 1 - n_vl
+    w[index] += value + n_vl
+
+
+def roll_priors(result, sizes, roll_ids, prior_temp):
+    """Splits the evaluation result of the next states of the moves of the rolls (sizes[i] states of roll_ids[i], in order) and returns (priors, value):
+    the priors of the moves of every roll and the value of the node, which is the values of the rolls weighted by their probabilities"""
+    priors = []
+    values = []
+    offset = 0
+    for size in sizes:
+        roll_result = result[offset: offset + size]
+        offset += size
+        p = softmax(roll_result, temp=prior_temp)
+        priors.append(p)
+        values.append(np.sum(p * roll_result))
+    probabilities = [ROLL_PROBABILITIES[roll_id] for roll_id in roll_ids]
+    return priors, np.dot(probabilities, values) / np.sum(probabilities)
+
+
 def softmax(a, temp=0.1):
     if temp == 0:
         temp += 0.001
@@ -105,102 +214,85 @@ def mcts_job(num, root, player, evaluator_conn, c_puct, n_vl, prior_temp):
         # SELECTION
         move_indices = []
         chk1 = time.perf_counter()
-        node.expansion_event.wait() # Before attending to any node, wait if another thread is expanding it
-        while node.expanded:
-            # Applying chance on SELECTION
-            rolls = [[i] for i in range(1, 6)] + [[6, i] for i in range(1, 6)] + [[6, 6, i] for i in range(1, 6)]
-            roll = choices(rolls)
-            
-            from_index, to_index = 0, len(node.available_moves)
-            found = False
-            for index, move_dict in enumerate(node.available_moves):
-                if move_dict["roll"] == roll and not found:
-                    from_index = index
-                    found = True
-                elif move_dict["roll"] != roll and found:
-                    to_index = index
-                    found = False
+        roll_id = None
+        while True:
+            wait_expansion(node)  # Before attending to any node, wait if another thread is expanding it
+            expanded = node.expanded
+            if expanded:
+                # Applying chance on SELECTION: a roll is sampled with its exact probability. A roll sampled for the first time at the node (or whose
+                # moves have no priors yet) ends the selection and its moves are generated and evaluated.
+                roll_id = node.sample_roll()
+            if not expanded or not node.roll_evaluated(player, roll_id):
+                if node.state["game_over"]:
                     break
-            if from_index >= to_index:
-                print(f"{num} from_index: {from_index} to_index: {to_index}")
+                # Claiming the expansion of the node (or roll). If another thread has expanded it in the meantime, the selection resumes at the node.
+                condition = expansion_condition(node)
+                with condition:
+                    while node.expanding:
+                        condition.wait()
+                    if node.expanded == expanded and not (expanded and node.roll_evaluated(player, roll_id)):
+                        node.expanding = True
+                        break
+                continue
+            from_index, to_index = node.segments[roll_id]
             p = node.stats[player.name]["P"][from_index:to_index]
             n = node.stats[player.name]["N"][from_index:to_index]
             w = node.stats[player.name]["W"][from_index:to_index]
 
             # Selecting a move
-            u = c_puct * p * (np.sqrt(np.sum(n)) / (1.0 + n))
-            chosen_move_index = np.argmax(w / n + u)
+            move_index = from_index + puct_select(p, n, w, c_puct)
 
-            # Applying virtual losses
-            n[chosen_move_index] += n_vl
-            w[chosen_move_index] -= n_vl
+            # Applying virtual losses (on the current arrays, the stats are replaced when another roll of the node is expanded)
+            with expansion_condition(node):
+                add_virtual_loss(node.stats[player.name]["N"], node.stats[player.name]["W"], move_index, n_vl)
 
-            move_indices.append(chosen_move_index + from_index)
-            node = node.children[chosen_move_index + from_index]
-            node.expansion_event.wait() # Before attending to any node, wait if another thread is expanding it
+            move_indices.append(move_index)
+            node = node.get_child(move_index)
         chk2 = time.perf_counter()
-        # EXPANSION
-        if not node.expansion_event.is_set():
-            # In the unfortunate case that a thread has already got passed event.wait() while another thread is expanding the same node, backup the virtual losses and discard the thread
-            node = node.parent
-            move_indices.reverse()
-
-            for move_index in move_indices:
-                node.stats[player.name]["N"][move_index] -= n_vl
-                node.stats[player.name]["W"][move_index] += n_vl
-                node = node.parent
-            print(f"{num} Unfortunate Ending! Selection: {chk2 - chk1}")
-            return 0
-        node.expansion_event.clear()
-        # print(f"{num} Expanding. Selection: {chk2 - chk1}")
-        if not node.state["game_over"]:
-            next_states = node.expand()
-        node.expansion_event.set()
-        chk3 = time.perf_counter()
-        # EVALUATION
-        # print(f"{num} Evaluating. Expansion: {chk3 - chk2}")
-        result = 0
-        if not node.state["game_over"]:
-            next_states = [deepcopy(state) for state in next_states]
-            for state in next_states:
-                state["current_player"] = node.state["current_player"]
-            states_serialized = base64.b64encode(
-                tf.io.serialize_tensor(
-                    tf.stack([node.model.state_to_repr(state) for state in next_states])).numpy()).decode(
-                'ascii')
-            result = tf.io.parse_tensor(base64.b64decode(evaluator_conn.root.evaluate(player.name, states_serialized)),
-                                        out_type=tf.float32).numpy()
-        else:
-            # Finding winner and setting result according to it
-            winner = None
-            for p in node.model.config.players:
-                not_finale = False
-                for colour in p.colours:
-                    for pawn in node.model.pawns[colour]:
-                        try:
-                            if node.state[p.name]["single_pawn_pos"][pawn.id] not in node.model.finale_positions:
-                                not_finale = True
-                        except:
-                            not_finale = True
-                if not not_finale:
-                    winner = p
-                    break
-            if winner:
-                result = 1 if winner == player else -1
-        chk4 = time.perf_counter()
-        # BACKUP
-        # print(f"{num} Backup. Evaluation: {chk4 - chk3}")
-        p = softmax(result, temp=prior_temp)
-        v = np.sum(p * result)
-        node.stats[player.name]["P"] = p
-        node = node.parent
-        move_indices.reverse()
-
-        for move_index in move_indices:
-            player_multipler = 1 if node.model.config.players[node.state["current_player"]] == player else -1
-            node.stats[player.name]["N"][move_index] += 1 - n_vl
-            node.stats[player.name]["W"][move_index] += (player_multipler * v) + n_vl
-            node = node.parent
+        # The claimed node (see SELECTION) is released only after the priors of its new moves are set, so that the waiting threads do not select over
+        # the placeholder priors
+        try:
+            # EXPANSION
+            # print(f"{num} Expanding. Selection: {chk2 - chk1}")
+            if not node.state["game_over"]:
+                # A new node is expanded and a roll is sampled for it. Only the moves of the sampled roll are generated.
+                if not node.expanded:
+                    node.expand()
+                    roll_id = node.sample_roll()
+                # The moves of the roll may have been generated without their priors (see actor.prune())
+                if not node.roll_expanded(roll_id):
+                    node.expand_roll(roll_id)
+                next_states = node.next_states(roll_id)
+            chk3 = time.perf_counter()
+            # EVALUATION
+            # print(f"{num} Evaluating. Expansion: {chk3 - chk2}")
+            result = 0
+            if not node.state["game_over"]:
+                # The next states are evaluated from the point of view of the current player
+                # The states are sent as binary records (see LudoCodec) and the evaluator builds their tensor representation
+                records = node.model.codec.encode_states(next_states)
+                records["current_player"] = node.state["current_player"]
+                result = np.frombuffer(evaluator_conn.root.evaluate(player.name, records.tobytes()), dtype=np.float32)
+            else:
+                # Finding winner and setting result according to it
+                winner = node.model.get_winner(node.state)
+                if winner is not None:
+                    result = 1 if node.model.config.players[winner] == player else -1
+            chk4 = time.perf_counter()
+            # BACKUP
+            # print(f"{num} Backup. Evaluation: {chk4 - chk3}")
+            if not node.state["game_over"]:
+                # The priors of the moves of the expanded roll are set and its value is backed up. Rolls are sampled with their probabilities, so the
+                # values of the nodes are weighted by the probabilities of the rolls.
+                v = node.set_priors(player, [roll_id], result, prior_temp)
+            else:
+                p = softmax(result, temp=prior_temp)
+                v = np.sum(p * result)
+                node.stats[player.name]["P"] = p
+        finally:
+            if not node.state["game_over"]:
+                end_expansion(node)
+        backup(node, move_indices, v, player, n_vl)
         chk5 = time.perf_counter()
         # print(f"{num} Num moves: {len(move_indices)} Ending: {chk5 - chk1}")
         return len(move_indices)
@@ -208,3 +300,449 @@ def mcts_job(num, root, player, evaluator_conn, c_puct, n_vl, prior_temp):
         # print(f"E: {str(e)}")
         #traceback.print_exc()
         return -1
+
+
+def backup(node, move_indices, v, player, n_vl):
+    """Adds the value v of the node to the moves leading to it from the root (move_indices) and removes their virtual losses"""
+    for move_index in reversed(move_indices):
+        node = node.parent
+        player_multipler = 1 if node.model.config.players[node.state["current_player"]] == player else -1
+        with expansion_condition(node):
+            backup_edge(node.stats[player.name]["N"], node.stats[player.name]["W"], move_index, player_multipler * v, n_vl)
+
+
+def select_leaf(root, player, c_puct, n_vl):
+    """Same selection as mcts_job() without waiting for other threads. Returns (node, move_indices, roll_id) where roll_id is the roll sampled at an
+    expanded node whose moves are not generated or not evaluated yet (None if the node itself is not expanded)."""
+    node = root
+    move_indices = []
+    while node.expanded:
+        roll_id = node.sample_roll()
+        if not node.roll_evaluated(player, roll_id):
+            return node, move_indices, roll_id
+        from_index, to_index = node.segments[roll_id]
+        p = node.stats[player.name]["P"][from_index:to_index]
+        n = node.stats[player.name]["N"][from_index:to_index]
+        w = node.stats[player.name]["W"][from_index:to_index]
+        move_index = from_index + puct_select(p, n, w, c_puct)
+        add_virtual_loss(node.stats[player.name]["N"], node.stats[player.name]["W"], move_index, n_vl)
+        move_indices.append(move_index)
+        node = node.get_child(move_index)
+    return node, move_indices, None
+
+
+def batched_search(root, player, evaluator_conn, num_simulations, batch_size=16, c_puct=5, n_vl=3, prior_temp=0.5):
+    """Single-threaded alternative to running mcts_job() in a thread pool. Every round descends batch_size paths with virtual losses, expands the leaves
+    they reach, evaluates the next states of all leaves in a single evaluate() call and backs up all results. Paths which reach the same leaf share its
+    evaluation. Returns the depth reached by every simulation."""
+    depths = []
+    while len(depths) < num_simulations:
+        # SELECTION of up to batch_size leaves
+        leaves = {}
+        for _ in range(min(batch_size, num_simulations - len(depths))):
+            node, move_indices, roll_id = select_leaf(root, player, c_puct, n_vl)
+            leaf = leaves.setdefault((id(node), roll_id), {"node": node, "roll_id": roll_id, "paths": []})
+            leaf["paths"].append(move_indices)
+            depths.append(len(move_indices))
+
+        try:
+            # EXPANSION: the moves of one roll of every leaf
+            next_states = []
+            current_players = []
+            for leaf in leaves.values():
+                node = leaf["node"]
+                if node.state["game_over"]:
+                    continue
+                # Leaves are claimed like in mcts_job() till their priors are set, in case threads search the same tree
+                node.expanding = leaf["claimed"] = True
+                if not node.expanded:
+                    node.expand()
+                    leaf["roll_id"] = node.sample_roll()
+                if not node.roll_expanded(leaf["roll_id"]):
+                    node.expand_roll(leaf["roll_id"])
+                states = node.next_states(leaf["roll_id"])
+                leaf["num_states"] = len(states)
+                next_states += states
+                current_players += [node.state["current_player"]] * len(states)
+
+            # EVALUATION of all next states in one call, from the point of view of the current player of their leaf
+            result = np.zeros(shape=(0,), dtype=np.float32)
+            if next_states:
+                records = root.model.codec.encode_states(next_states)
+                records["current_player"] = current_players
+                result = np.frombuffer(evaluator_conn.root.evaluate(player.name, records.tobytes()), dtype=np.float32)
+
+            # BACKUP
+            offset = 0
+            for leaf in leaves.values():
+                node = leaf["node"]
+                if node.state["game_over"]:
+                    winner = node.model.get_winner(node.state)
+                    v = 0 if winner is None else 1 if node.model.config.players[winner] == player else -1
+                else:
+                    v = node.set_priors(player, [leaf["roll_id"]], result[offset: offset + leaf["num_states"]], prior_temp)
+                    offset += leaf["num_states"]
+                    end_expansion(node)
+                    leaf["claimed"] = False
+                for move_indices in leaf["paths"]:
+                    backup(node, move_indices, v, player, n_vl)
+        finally:
+            for leaf in leaves.values():
+                if leaf.get("claimed"):
+                    end_expansion(leaf["node"])
+    return depths
+
+
+class RootParallelSearch:
+    """Root-parallel MCTS: num_workers processes search independent trees of the same root (state and roll) with different random seeds and split the
+    simulations between them. The statistics of the root moves of all trees are merged. The workers run batched_search() and send their evaluation
+    requests to the process which calls search(). It forwards all pending requests to the evaluator in one call, so the workers share its single
+    connection.
+        Methods:
+            - search(state, roll, player_colour, player_index, evaluator_conn, num_simulations, seed=None): Searches the moves of the roll in the state for
+                        the player of the GameConfig(player_colour). Returns (moves, N, W, depths): the moves of the roll searched by the workers, their
+                        visit counts and value sums summed over all trees and the depth reached by every simulation.
+            - merge(node, roll, player, moves, N, W): Writes the statistics returned by search() into the moves of the roll of the node (see
+                        merge_root_stats())
+            - close(): Stops the workers
+    """
+
+    def __init__(self, num_workers=4, batch_size=16, c_puct=5, n_vl=3, prior_temp=0.5):
+        # Workers are spawned (not forked) since the calling process usually runs threads and holds connections
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.tasks = [context.Queue() for _ in range(num_workers)]
+        self.replies = [context.Queue() for _ in range(num_workers)]
+        self.workers = [context.Process(target=_root_parallel_worker, args=(i, self.tasks[i], self.requests, self.replies[i], batch_size, c_puct, n_vl,
+                                                                            prior_temp), name=f"MCTS worker {i}", daemon=True) for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def search(self, state, roll, player_colour, player_index, evaluator_conn, num_simulations, seed=None):
+        seed = random.getrandbits(32) if seed is None else seed
+        num_workers = len(self.workers)
+        for worker_id, tasks in enumerate(self.tasks):
+            worker_simulations = num_simulations // num_workers + (worker_id < num_simulations % num_workers)
+            tasks.put((state, roll, player_colour, player_index, worker_simulations, seed + worker_id))
+
+        results = [None] * num_workers
+        while any(result is None for result in results):
+            # Serve all pending evaluation requests of the workers with a single evaluator call
+            requests = []
+            while not requests:
+                try:
+                    requests.append(self.requests.get(timeout=1))
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in self.workers):
+                        raise RuntimeError("A root-parallel MCTS worker has died")
+            while True:
+                try:
+                    requests.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            evaluations = []
+            for request in requests:
+                if request[0] == "done":
+                    results[request[1]] = request[2:]
+                else:
+                    evaluations.append(request)
+            if evaluations:
+                result = np.frombuffer(evaluator_conn.root.evaluate(evaluations[0][2], b"".join(request[3] for request in evaluations)),
+                                       dtype=np.float32)
+                offset = 0
+                for _, worker_id, _, records in evaluations:
+                    num_states = len(records) // STATE_RECORD.itemsize
+                    self.replies[worker_id].put(result[offset: offset + num_states].tobytes())
+                    offset += num_states
+
+        # The statistics of every tree are matched to the moves of the first tree by move. Every tree starts its moves at one visit, which is counted
+        # once in the merged visit counts.
+        moves = results[0][0]
+        N, W = np.ones(shape=(len(moves),)), np.zeros(shape=(len(moves),))
+        for worker_moves, worker_n, worker_w, _ in results:
+            indices = match_moves(worker_moves, moves)
+            N[indices] += np.asarray(worker_n) - 1
+            W[indices] += worker_w
+        return moves, N, W, [depth for result in results for depth in result[3]]
+
+    @staticmethod
+    def merge(node, roll, player, moves, N, W):
+        merge_root_stats(node, ROLL_IDS[tuple(roll)], player, moves, N, W)
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+def match_moves(moves, other_moves):
+    """Returns the index in moves of every move of other_moves. Moves are matched by their normalized form since the move lists of two trees need not
+    be in the same order. Raises ValueError if the two lists do not hold the same moves."""
+    positions = {normalize_move(move): i for i, move in enumerate(moves)}
+    indices = [positions.get(normalize_move(move)) for move in other_moves]
+    if len(positions) != len(moves) or len(indices) != len(moves) or None in indices:
+        raise ValueError(f"The moves {moves} differ from the moves {other_moves}")
+    return indices
+
+
+def merge_root_stats(node, roll_id, player, moves, N, W):
+    """Sets the visit counts N and value sums W of the moves of the roll of the node from the statistics of the same moves searched in another tree
+    (matched by match_moves())"""
+    from_index, to_index = node.segments[roll_id]
+    indices = match_moves(moves, [move["move"] for move in node.available_moves[from_index: to_index]])
+    with expansion_condition(node):
+        node.stats[player.name]["N"][from_index: to_index] = np.asarray(N)[indices]
+        node.stats[player.name]["W"][from_index: to_index] = np.asarray(W)[indices]
+
+
+class _QueueEvaluator:
+    """Stands in for the evaluator connection (conn.root.evaluate(player_name, records)) in a worker of RootParallelSearch"""
+
+    def __init__(self, worker_id, requests, replies):
+        self.root = self
+        self.worker_id = worker_id
+        self.requests = requests
+        self.replies = replies
+
+    def evaluate(self, player_name, records):
+        self.requests.put(("evaluate", self.worker_id, player_name, records))
+        return self.replies.get()
+
+
+def _root_parallel_worker(worker_id, tasks, requests, replies, batch_size, c_puct, n_vl, prior_temp):
+    evaluator = _QueueEvaluator(worker_id, requests, replies)
+    models = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        state, roll, player_colour, player_index, num_simulations, seed = task
+        random.seed(seed)
+        np.random.seed(seed % (1 << 32))
+        # The model (and its move cache) is kept for the next searches of the same game configuration
+        key = tuple(tuple(colours) for colours in player_colour)
+        if key not in models:
+            models[key] = LudoModel(GameConfig(player_colour), persistent=True)
+        model = models[key]
+        player = model.config.players[player_index]
+
+        root = MCTNode(state, model.config.players, model, None)
+        roll_id = ROLL_IDS[tuple(roll)]
+        root.expand()
+        root.expand_roll(roll_id)
+        root.prune(roll_id)
+        # The first simulation evaluates the moves of the root, so all workers start from the same priors
+        depths = batched_search(root, player, evaluator, num_simulations, batch_size, c_puct, n_vl, prior_temp)
+        requests.put(("done", worker_id, [move["move"] for move in root.available_moves], root.stats[player.name]["N"], root.stats[player.name]["W"],
+                      depths))
+
+
+class NodePool:
+    """Struct-of-arrays storage of an MCTS tree searched for one player, an alternative to a tree of MCTNode objects. Nodes and edges (moves) are rows of
+    preallocated flat arrays, so selection and backup are array indexing and a node only takes about 200 bytes plus about 30 bytes per edge. The tree
+    grows lazily like a tree of MCTNode: the moves of a roll are generated when the roll is sampled for the first time and a child when its edge is
+    selected for the first time. The arrays grow by doubling up to max_bytes, after which a MemoryError is raised. A NodePool is not thread-safe:
+    simulations are run one after another.
+        Node arrays (indexed by node):
+            - parent, parent_edge: Parent node and the edge leading to the node (-1 for the root)
+            - expanded: Whether the node is expanded (see MCTNode.expand())
+            - segments: The edges of the roll POSSIBLE_ROLLS[r] are segments[node, r] = [from_index, to_index) ([-1, -1] until the moves of the roll are
+                        generated)
+            - evaluated: Whether the priors of the edges of a roll are set
+            - states: State of the node as a STATE_RECORD (see LudoCodec)
+        Edge arrays (indexed by edge):
+            - prior, visits, value_sum: Statistics of the edge for the searching player. visits start at 1 and virtual losses are applied to visits and
+                        value_sum as in MCTNode.
+            - child: Node reached by the edge (-1 until the edge is selected for the first time)
+            - moves, multiplicity: The move as a MOVE_RECORD and the number of symmetric moves it stands for (see LudoModel.distinct_moves())
+        Methods:
+            - reset(state, roll=None): Clears the pool and makes the state its root. If roll is given, only the moves of the roll are searched at the root.
+            - select(c_puct, n_vl): Descends from the root applying virtual losses. Returns (node, path, roll_id) where path is the list of (node, edge)
+                        taken and roll_id is the roll sampled at an expanded node whose edges are not generated or not evaluated yet (None if the node
+                        itself is not expanded).
+            - expand(node): Expands the node. Edges are only generated for a roll when it is sampled (see expand_roll()).
+            - expand_roll(node, roll_id): Generates the edges of the roll
+            - next_states(node, roll_id): Returns the next states of the edges of the roll as STATE_RECORDs
+            - set_priors(node, roll_ids, result, prior_temp): Same as MCTNode.set_priors() for the evaluation result of the next states of the rolls
+            - backup(path, value, n_vl): Adds the value to the edges of the path and removes their virtual losses
+            - simulate(evaluator_conn, c_puct, n_vl, prior_temp): Runs one simulation (same steps as mcts_job()) and returns the depth reached
+            - root_moves(): Returns (moves, visits, value_sums) of the generated edges of the root
+    """
+
+    def __init__(self, model, player, node_capacity=1024, edge_capacity=16384, max_bytes=1 << 30):
+        self.model = model
+        self.player = player
+        self.player_index = model.config.players.index(player)
+        self.max_bytes = max_bytes
+        self.num_rolls = len(POSSIBLE_ROLLS)
+        self.node_arrays = {"parent": np.int32, "parent_edge": np.int32, "expanded": np.bool_, "segments": (np.int32, (self.num_rolls, 2)),
+                            "evaluated": (np.bool_, (self.num_rolls,)), "states": STATE_RECORD}
+        self.edge_arrays = {"prior": np.float32, "visits": np.float32, "value_sum": np.float32, "child": np.int32, "multiplicity": np.uint16,
+                            "moves": MOVE_RECORD}
+        self.node_capacity = 0
+        self.edge_capacity = 0
+        self._resize(self.node_arrays, node_capacity, 0)
+        self._resize(self.edge_arrays, edge_capacity, 0)
+        self.node_capacity = node_capacity
+        self.edge_capacity = edge_capacity
+        self.used_nodes = 0
+        self.used_edges = 0
+        self.root_state = None
+        self.root_roll = None
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in list(self.node_arrays) + list(self.edge_arrays))
+
+    def _resize(self, arrays, capacity, used):
+        # Replaces the arrays with arrays of the given capacity and copies the used rows
+        for name, dtype in arrays.items():
+            shape = (capacity,) if not isinstance(dtype, tuple) else (capacity, *dtype[1])
+            array = np.zeros(shape, dtype=dtype if not isinstance(dtype, tuple) else dtype[0])
+            if used:
+                array[:used] = getattr(self, name)[:used]
+            setattr(self, name, array)
+
+    def _reserve(self, num_nodes, num_edges):
+        # Grows the node and edge arrays by doubling so that num_nodes more nodes and num_edges more edges fit
+        node_capacity, edge_capacity = self.node_capacity, self.edge_capacity
+        while self.used_nodes + num_nodes > node_capacity:
+            node_capacity *= 2
+        while self.used_edges + num_edges > edge_capacity:
+            edge_capacity *= 2
+        if node_capacity == self.node_capacity and edge_capacity == self.edge_capacity:
+            return
+        node_bytes = sum(getattr(self, name).nbytes for name in self.node_arrays) // self.node_capacity
+        edge_bytes = sum(getattr(self, name).nbytes for name in self.edge_arrays) // self.edge_capacity
+        if node_capacity * node_bytes + edge_capacity * edge_bytes > self.max_bytes:
+            raise MemoryError(f"NodePool would exceed {self.max_bytes} bytes")
+        if node_capacity != self.node_capacity:
+            self._resize(self.node_arrays, node_capacity, self.used_nodes)
+            self.node_capacity = node_capacity
+        if edge_capacity != self.edge_capacity:
+            self._resize(self.edge_arrays, edge_capacity, self.used_edges)
+            self.edge_capacity = edge_capacity
+
+    def _add_node(self, parent, parent_edge, state):
+        # Appends the node of the state reached from parent by parent_edge and returns its index
+        self._reserve(1, 0)
+        node = self.used_nodes
+        self.parent[node] = parent
+        self.parent_edge[node] = parent_edge
+        self.expanded[node] = False
+        self.segments[node] = -1
+        self.evaluated[node] = False
+        self.states[node] = self.model.codec.encode_states([state])[0]
+        self.used_nodes += 1
+        return node
+
+    def _state(self, node):
+        # The root keeps the state it was reset with, so that its moves are generated in the same order as for an MCTNode of the state
+        if node == 0:
+            return dict(self.root_state)
+        return self.model.codec.decode_states(self.states[node: node + 1])[0]
+
+    def _sample_roll(self, node):
+        # Chance: the roll is sampled with its exact probability, the root only searches its known roll
+        if node == 0 and self.root_roll is not None:
+            return self.root_roll
+        return choices(range(self.num_rolls), cum_weights=ROLL_CUM_WEIGHTS)[0]
+
+    def reset(self, state, roll=None):
+        self.used_nodes = 0
+        self.used_edges = 0
+        self.root_state = state
+        self.root_roll = ROLL_IDS[tuple(roll)] if roll is not None else None
+        self._add_node(-1, -1, state)
+
+    def select(self, c_puct, n_vl):
+        node = 0
+        path = []
+        while self.expanded[node]:
+            roll_id = self._sample_roll(node)
+            if not self.evaluated[node, roll_id]:
+                return node, path, roll_id
+            from_index, to_index = self.segments[node, roll_id]
+            edge = from_index + puct_select(self.prior[from_index: to_index], self.visits[from_index: to_index], self.value_sum[from_index: to_index],
+                                            c_puct)
+            add_virtual_loss(self.visits, self.value_sum, edge, n_vl)
+            path.append((node, edge))
+            if self.child[edge] < 0:
+                # The child is created when its edge is selected for the first time
+                state = self._state(node)
+                state["dice_roll"] = POSSIBLE_ROLLS[roll_id]
+                move = self.model.codec.decode_moves(self.moves[edge: edge + 1])[0]
+                self.child[edge] = self._add_node(node, edge, self.model.generate_next_state(state, move))
+            node = self.child[edge]
+        return node, path, None
+
+    def expand(self, node):
+        self.expanded[node] = True
+
+    def expand_roll(self, node, roll_id):
+        # Moves whose next states are symmetric are expanded once (see MCTNode.expand_roll())
+        moves, multiplicities = self.model.distinct_moves(self._state(node), POSSIBLE_ROLLS[roll_id])
+        if len(moves) == 0:
+            moves, multiplicities = [[[]]], [1]
+        self._reserve(0, len(moves))
+        edges = slice(self.used_edges, self.used_edges + len(moves))
+        self.prior[edges] = 1 / len(moves)
+        self.visits[edges] = 1
+        self.value_sum[edges] = 0
+        self.child[edges] = -1
+        self.multiplicity[edges] = multiplicities
+        self.moves[edges] = self.model.codec.encode_moves(moves)
+        self.segments[node, roll_id] = edges.start, edges.stop
+        self.used_edges += len(moves)
+
+    def next_states(self, node, roll_id):
+        from_index, to_index = self.segments[node, roll_id]
+        state = self._state(node)
+        state["dice_roll"] = POSSIBLE_ROLLS[roll_id]
+        moves = self.model.codec.decode_moves(self.moves[from_index: to_index])
+        return self.model.codec.encode_states([self.model.generate_next_state(state, move) for move in moves])
+
+    def set_priors(self, node, roll_ids, result, prior_temp):
+        priors, value = roll_priors(result, [self.segments[node, roll_id, 1] - self.segments[node, roll_id, 0] for roll_id in roll_ids], roll_ids,
+                                    prior_temp)
+        for roll_id, p in zip(roll_ids, priors):
+            from_index, to_index = self.segments[node, roll_id]
+            self.prior[from_index: to_index] = p
+            self.evaluated[node, roll_id] = True
+        return value
+
+    def backup(self, path, value, n_vl):
+        if not path:
+            return
+        nodes, edges = np.array(path).T
+        player_multiplier = np.where(self.states["current_player"][nodes] == self.player_index, 1, -1)
+        backup_edge(self.visits, self.value_sum, edges, player_multiplier * value, n_vl)
+
+    def simulate(self, evaluator_conn, c_puct, n_vl, prior_temp):
+        # SELECTION
+        node, path, roll_id = self.select(c_puct, n_vl)
+        # EXPANSION and EVALUATION
+        if self.states["game_over"][node]:
+            winner = self.model.get_winner(self._state(node))
+            value = 0 if winner is None else 1 if winner == self.player_index else -1
+        else:
+            # A new node is expanded and a roll is sampled for it. Only the moves of the sampled roll are generated.
+            if not self.expanded[node]:
+                self.expand(node)
+                roll_id = self._sample_roll(node)
+            if self.segments[node, roll_id, 0] < 0:
+                self.expand_roll(node, roll_id)
+            # The next states are evaluated from the point of view of the current player
+            records = self.next_states(node, roll_id)
+            records["current_player"] = self.states["current_player"][node]
+            result = np.frombuffer(evaluator_conn.root.evaluate(self.player.name, records.tobytes()), dtype=np.float32)
+            value = self.set_priors(node, [roll_id], result, prior_temp)
+        # BACKUP
+        self.backup(path, value, n_vl)
+        return len(path)
+
+    def root_moves(self):
+        roll_ids = [self.root_roll] if self.root_roll is not None else range(self.num_rolls)
+        edges = np.array([edge for roll_id in roll_ids for edge in range(*self.segments[0, roll_id])], dtype=np.int64)
+        return self.model.codec.decode_moves(self.moves[edges]), self.visits[edges].copy(), self.value_sum[edges].copy()
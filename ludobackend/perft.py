@@ -0,0 +1,135 @@
+import argparse
+import time
+from copy import deepcopy
+from ludo import Ludo, GameConfig, POSSIBLE_ROLLS
+from ludo_compact import CompactLudoModel, GAME_OVER
+from benchmark import TEAM_CONFIG, FOUR_PLAYER_CONFIG, build_corpus
+
+""" This file contains the perft (performance test) tool of the Ludo Engine. It enumerates every roll sequence and every move up to a given depth and counts
+the leaf positions. The counts are a fingerprint of the rules: an optimized engine must produce the same counts as LudoModel. In the differential mode, two
+engines are walked side by side and the first position where they disagree is reported.
+    Usage: python perft.py --depth 2 [--position opening] [--diff]
+"""
+
+
+class DictEngine:
+    """Adapter of LudoModel for perft"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def children(self, state, roll):
+        """Returns [(move, next state)] of the roll ([[]] is the move if there is no move)"""
+        state = dict(state)
+        state["dice_roll"] = roll
+        moves = self.model.possible_moves(state, roll) or [[[]]]
+        return [(move, self.model.generate_next_state(state, move)) for move in moves]
+
+    def game_over(self, state):
+        return state["game_over"]
+
+    def normalize(self, state):
+        return normalize_jsonable(self.model.get_state_jsonable(state))
+
+
+class CompactEngine:
+    """Adapter of CompactLudoModel for perft"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def children(self, state, roll):
+        state = bytearray(state)
+        self.model.set_dice_roll(state, roll)
+        moves = self.model.possible_moves(state, roll) or [[[]]]
+        return [(move, self.model.generate_next_state(state, move)) for move in moves]
+
+    def game_over(self, state):
+        return bool(state[GAME_OVER])
+
+    def normalize(self, state):
+        return normalize_jsonable(self.model.get_state_jsonable(state))
+
+
+def normalize_jsonable(state):
+    # Block ids, dice roll and move ids are not part of the position
+    return (state["game_over"], state["current_player"], state["num_more_moves"],
+            tuple(sorted((p["pawn_id"], p["pos_id"]) for p in state["positions"])),
+            tuple(sorted((tuple(sorted(b["pawn_ids"])), b["rigid"]) for b in state["blocks"])))
+
+
+def normalize_move(move):
+    # The order of the pawns of a block move depends on the insertion order of the state dictionary
+    return tuple((tuple(sorted(m[0])) if isinstance(m[0], (list, tuple)) else m[0],) + tuple(m[1:]) for m in move if m)
+
+
+def perft(engine, state, depth):
+    """Returns the number of leaf positions after depth plies. Every ply tries all roll sequences. Finished games are leaves."""
+    if depth == 0 or engine.game_over(state):
+        return 1
+    nodes = 0
+    for roll in POSSIBLE_ROLLS:
+        for _, next_state in engine.children(state, roll):
+            nodes += perft(engine, next_state, depth - 1)
+    return nodes
+
+
+def perft_divide(engine, state, depth):
+    """Same as perft but returns the leaf counts of every roll sequence of the first ply along with the time taken"""
+    start = time.perf_counter()
+    counts = {}
+    for roll in POSSIBLE_ROLLS:
+        counts[tuple(roll)] = sum(perft(engine, next_state, depth - 1) for _, next_state in engine.children(state, roll))
+    return counts, time.perf_counter() - start
+
+
+def perft_diff(engine1, state1, engine2, state2, depth, path=()):
+    """Walks both engines in lockstep up to depth plies. Returns None if they agree everywhere, else a dictionary describing the first diverging
+    position: the path of (roll, move) from the root, the position (as normalized by engine1) and what differs."""
+    position = engine1.normalize(state1)
+    if position != engine2.normalize(state2):
+        return {"path": list(path), "position": position, "difference": "state", "expected": position, "found": engine2.normalize(state2)}
+    if depth == 0 or engine1.game_over(state1):
+        return None
+    for roll in POSSIBLE_ROLLS:
+        children1 = sorted(((normalize_move(move), next_state) for move, next_state in engine1.children(state1, roll)), key=lambda c: repr(c[0]))
+        children2 = sorted(((normalize_move(move), next_state) for move, next_state in engine2.children(state2, roll)), key=lambda c: repr(c[0]))
+        moves1, moves2 = [move for move, _ in children1], [move for move, _ in children2]
+        if moves1 != moves2:
+            return {"path": list(path), "position": position, "roll": roll, "difference": "moves",
+                    "missing": sorted(set(moves1) - set(moves2), key=repr), "extra": sorted(set(moves2) - set(moves1), key=repr),
+                    "counts": (len(moves1), len(moves2))}
+        for (move, next_state1), (_, next_state2) in zip(children1, children2):
+            divergence = perft_diff(engine1, next_state1, engine2, next_state2, depth - 1, path + ((roll, move),))
+            if divergence is not None:
+                return divergence
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--depth", type=int, default=2, help="Number of plies to enumerate")
+    parser.add_argument("--position", type=str, default="initial", help="'initial' or the name of a position of the benchmark corpus")
+    parser.add_argument("--four_players", action="store_true", help="Use four players instead of two teams for the initial position")
+    parser.add_argument("--diff", action="store_true", help="Compare LudoModel against CompactLudoModel instead of counting")
+    args = parser.parse_args()
+
+    if args.position == "initial":
+        engine = Ludo(GameConfig(FOUR_PLAYER_CONFIG if args.four_players else TEAM_CONFIG))
+        model, state = engine.model, engine.state
+    else:
+        model, state = {name: (model, state) for name, model, state in build_corpus()}[args.position]
+    dict_engine = DictEngine(model)
+
+    if args.diff:
+        compact_model = CompactLudoModel(model.config)
+        start = time.perf_counter()
+        divergence = perft_diff(dict_engine, deepcopy(state), CompactEngine(compact_model), compact_model.from_dict(state), args.depth)
+        print(f"Compared in {time.perf_counter() - start:.2f}s")
+        print("No divergence" if divergence is None else f"First divergence: {divergence}")
+    else:
+        counts, elapsed = perft_divide(dict_engine, state, args.depth)
+        for roll, count in counts.items():
+            print(f"{list(roll)}: {count}")
+        total = sum(counts.values())
+        print(f"Total: {total} nodes in {elapsed:.2f}s ({total / elapsed:.1f} nodes/sec)")
@@ -0,0 +1,133 @@
+import random
+from array import array
+from multiprocessing import Pool
+from ludo import GameConfig
+from ludo_compact import CompactLudoModel, NUM_PAWNS, POS, BLOCK, CURRENT_PLAYER, GAME_OVER
+
+""" This file contains the fast playout mode of the Ludo Engine. Games are played on compact states (see ludo_compact.py) with a cheap policy instead of
+the neural network. It is used to fill the experience store with bootstrap games and to evaluate leaves cheaply.
+    Usage: games = play_games([[LudoModel.RED, LudoModel.YELLOW], [LudoModel.GREEN, LudoModel.BLUE]], 1000, policy="heuristic")
+"""
+
+# Move indices are stored as unsigned shorts in a trajectory, this index marks a pass move ([[]])
+PASS = 0xFFFF
+MAX_MOVES = 10000
+
+
+def random_policy(model, state, moves, rng):
+    """Chooses one of the moves uniformly at random and returns its index"""
+    return rng.randrange(len(moves))
+
+
+def heuristic_policy(model, state, moves, rng):
+    """Prefers captures, then reaching the finale, then taking pawns out of the base and then advancing as far as possible. Ties are broken at random.
+    Every step of a move is scored on the state before the move."""
+    current_player = state[CURRENT_PLAYER]
+    opponent_singles = {state[POS + i] for i in range(NUM_PAWNS) if
+                        model.pawn_player[i] not in (-1, current_player) and not state[BLOCK + i]}
+    best_score, best = None, []
+    for index, move in enumerate(moves):
+        score = 0
+        for pawn, current_pos, destination in move:
+            source, target = model.square_index[current_pos], model.square_index[destination]
+            colour = model.pawn_index[pawn if isinstance(pawn, str) else pawn[0]] // 4
+            track_index = model.track_index[colour]
+            if track_index[source] < 0:
+                score += 30
+            else:
+                score += track_index[target] - track_index[source]
+            if isinstance(pawn, str) and target in opponent_singles and target not in model.stars:
+                score += 100
+            if target in model.finale_positions:
+                score += 50
+        if best_score is None or score > best_score:
+            best_score, best = score, [index]
+        elif score == best_score:
+            best.append(index)
+    return rng.choice(best)
+
+
+POLICIES = {"random": random_policy, "heuristic": heuristic_policy}
+
+
+def get_winner(model, state, winner):
+    """Returns the winner after a move: the first player who gets all pawns to the finale, or the current player if the game ended without one"""
+    if winner < 0:
+        for player_idx in range(len(model.config.players)):
+            if model.all_pawns_in_finale(state, player_idx):
+                return player_idx
+        if state[GAME_OVER]:
+            return state[CURRENT_PLAYER]
+    return winner
+
+
+def playout(model, state, policy=random_policy, rng=None, max_moves=MAX_MOVES, record=True):
+    """Plays the game of the compact state till the end with the policy.
+    Returns {"winner": player index (-1 if max_moves were reached), "num_moves": moves taken, "states": all compact states of the game joined as bytes,
+    "actions": array of the index of the chosen move in every state (PASS if there was no move)}. states and actions are left empty if record is False."""
+    rng = rng or random.Random()
+    state = bytearray(state)
+    states, actions = bytearray(), array("H")
+    winner = -1
+    num_moves = 0
+    while not state[GAME_OVER] and num_moves < max_moves:
+        roll = _roll(rng)
+        model.set_dice_roll(state, roll)
+        moves = model.possible_moves(state, roll)
+        action = policy(model, state, moves, rng) if moves else PASS
+        if record:
+            states += state
+            actions.append(action)
+        state = model.generate_next_state(state, moves[action] if moves else [[]])
+        winner = get_winner(model, state, winner)
+        num_moves += 1
+    return {"winner": winner, "num_moves": num_moves, "states": bytes(states), "actions": actions}
+
+
+def leaf_value(model, state, num_playouts=8, policy=random_policy, rng=None):
+    """Cheap evaluation of a state by playouts. state can be a compact state or a LudoModel state dictionary.
+    Returns the fraction of playouts won by every player."""
+    if isinstance(state, dict):
+        state = model.from_dict(state)
+    rng = rng or random.Random()
+    wins = [0] * len(model.config.players)
+    for _ in range(num_playouts):
+        winner = playout(model, state, policy, rng, record=False)["winner"]
+        if winner >= 0:
+            wins[winner] += 1
+    return [w / num_playouts for w in wins]
+
+
+def _roll(rng):
+    # Same as LudoModel.generate_dice_roll but with the given random generator
+    roll = [rng.randint(1, 6)]
+    while roll[-1] == 6 and len(roll) < 3:
+        roll.append(rng.randint(1, 6))
+    return roll
+
+
+def play_game(model, policy="random", seed=None, record=True):
+    """Plays a full game from the initial state"""
+    policy = POLICIES.get(policy, policy)
+    return playout(model, model.new_state(), policy, random.Random(seed), record=record)
+
+
+_worker_model = None
+
+
+def _init_worker(player_colour):
+    global _worker_model
+    _worker_model = CompactLudoModel(GameConfig(player_colour))
+
+
+def _play_worker(args):
+    policy, seed, record = args
+    return play_game(_worker_model, policy, seed, record)
+
+
+def play_games(player_colour, num_games, policy="random", processes=None, seed=0, record=True):
+    """Plays num_games games of the colour configuration (see GameConfig) in a multiprocessing pool and returns the list of play_game() results.
+    policy is a name in POLICIES or a picklable function policy(model, state, moves, rng) -> index of the chosen move."""
+    tasks = [(policy, seed + i, record) for i in range(num_games)]
+    with Pool(processes, initializer=_init_worker, initargs=(player_colour,)) as pool:
+        return pool.map(_play_worker, tasks, chunksize=max(1, num_games // (4 * (processes or 8))))
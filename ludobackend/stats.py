@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 import json
 import pandas as pd
+from ludo import LudoCodec
 
 
 """ This file is used to calculate the statistics (Wins and Losses ) for a player """
@@ -15,11 +16,16 @@ for AGENT_NAME in AGENT_NAMES:
     wins = 0
     losses = 0
     for file in os.listdir(agent_log_path):
-        with open(agent_log_path / file, mode='r', encoding="utf-8") as f:
-            if json.loads(f.read())["player_won"] == 1:
-                wins += 1
-            else:
-                losses += 1
+        if file.endswith(".bin"):
+            with open(agent_log_path / file, mode='rb') as f:
+                player_won = LudoCodec.read_game(f.read())["winner"] + 1
+        else:
+            with open(agent_log_path / file, mode='r', encoding="utf-8") as f:
+                player_won = json.loads(f.read())["player_won"]
+        if player_won == 1:
+            wins += 1
+        else:
+            losses += 1
     info["agent"].append(AGENT_NAME)
     info["wins"].append(wins)
     info["losses"].append(losses)
@@ -0,0 +1,76 @@
+""" This file contains the precomputed tables of the Ludo board which are used by the Ludo Engine to validate and take moves """
+
+
+class BoardTopology:
+    """ This class precomputes everything about the board that does not depend on the state of the game. It is built once per LudoModel and is supposed to be
+    used as LudoModel.topology
+        Attributes:
+            - squares: List of all position names. The index of a position in this list is its square number which is also used by the compact state (ludo_compact.py).
+                    squares = ["" (pawn not in game), "P1", ..., "P52", "RH1", ..., "RH6", "GH1", ..., "BH6", "RB1", ..., "RB4", "GB1", ..., "BB4"]
+            - square_index: Inverse mapping of squares. square_index = {"P1": 1, ...}
+            - bits: Bit of every position in a square bitset. bits = {"P1": 1 << 1, ...}
+            - home_stars, stars, inner_stars, finale_positions, safe_positions: Sets of positions (safe positions are the positions where blocks break up)
+            - home_star_mask, star_mask, finale_mask: The same sets as square bitsets
+            - track_index: Index of every position in the track of a colour. Base positions are mapped to -6 so that a 6 takes the pawn to the first position of
+                    the track. track_index = {"red": {"RB1": -6, ..., "P2": 0, ..., "RH6": 56}, ...}
+            - track_squares: The track of every colour as square numbers
+            - track_square_index: Same as track_index but as a list indexed by square number (-1 if the square is not on the track)
+            - jump_masks: jump_masks[colour][index][steps] is the bitset of all squares (except home stars) that a pawn jumps over when it moves "steps" positions
+                    from "index" in its track. A move is blocked by a blockade if jump_masks[colour][index][steps] & blockade_mask(...) is not zero.
+        Methods:
+            - mask(positions): Returns the bitset of the given positions
+            - blockade_mask(state, players): Returns the bitset of all positions occupied by the blocks of the given players in the state
+    """
+
+    MAX_STEPS = 6
+
+    def __init__(self, main_track, tracks, bases, stars, finale_positions):
+        colours = list(tracks.keys())
+        self.squares = [""] + list(main_track) + [pos for colour in colours for pos in tracks[colour][-6:]] + \
+                       [pos for colour in colours for pos in bases[colour]]
+        self.square_index = {pos: square for square, pos in enumerate(self.squares) if pos}
+        self.bits = {pos: 1 << square for pos, square in self.square_index.items()}
+
+        self.home_stars = frozenset(stars[:4])
+        self.stars = frozenset(stars)
+        self.inner_stars = frozenset(stars[4:])
+        self.finale_positions = frozenset(finale_positions)
+        self.safe_positions = self.home_stars | self.finale_positions
+        self.home_star_mask = self.mask(self.home_stars)
+        self.star_mask = self.mask(self.stars)
+        self.finale_mask = self.mask(self.finale_positions)
+
+        self.track_index = {}
+        self.track_squares = {}
+        self.track_square_index = {}
+        self.jump_masks = {}
+        for colour in colours:
+            track = tracks[colour]
+            self.track_index[colour] = {pos: i for i, pos in enumerate(track)}
+            self.track_index[colour].update({pos: -6 for pos in bases[colour]})
+            self.track_squares[colour] = [self.square_index[pos] for pos in track]
+            self.track_square_index[colour] = [-1] * len(self.squares)
+            for pos, i in self.track_index[colour].items():
+                self.track_square_index[colour][self.square_index[pos]] = i
+
+            jump_masks = []
+            for index in range(len(track)):
+                masks = [0] * (self.MAX_STEPS + 1)
+                for steps in range(2, self.MAX_STEPS + 1):
+                    jumped = [pos for pos in track[index + 1: index + steps] if pos not in self.home_stars]
+                    masks[steps] = self.mask(jumped)
+                jump_masks.append(masks)
+            self.jump_masks[colour] = jump_masks
+
+    def mask(self, positions):
+        mask = 0
+        for pos in positions:
+            mask |= self.bits[pos]
+        return mask
+
+    def blockade_mask(self, state, players):
+        mask = 0
+        for player in players:
+            for pos in state[player.name]["block_pawn_pos"].values():
+                mask |= self.bits[pos]
+        return mask
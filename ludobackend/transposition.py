@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from threading import Lock
+
+""" This file contains the transposition table which is used to memoize results of the Ludo Engine by the Zobrist hash of a state """
+
+
+class TranspositionTable:
+    """ A bounded, thread safe mapping from a key (usually built from LudoModel's state["hash"]) to a result. When the table is full, an entry is evicted
+    according to the eviction policy:
+            - TranspositionTable.LRU: The least recently used entry is evicted
+            - TranspositionTable.FIFO: The oldest inserted entry is evicted
+        Attributes:
+            - max_size: Maximum number of entries kept in the table
+            - eviction: Eviction policy
+            - hits, misses: Lookup statistics
+        Methods:
+            - get(key, default=None): Returns the stored result of the key or default
+            - put(key, value): Stores the result of the key
+            - clear(): Removes all entries and resets the statistics
+    """
+
+    LRU = "lru"
+    FIFO = "fifo"
+
+    def __init__(self, max_size=100000, eviction=LRU):
+        if eviction not in (TranspositionTable.LRU, TranspositionTable.FIFO):
+            raise ValueError(f"Unknown eviction policy {eviction}")
+        if max_size <= 0:
+            raise ValueError("max_size should be positive")
+        self.max_size = max_size
+        self.eviction = eviction
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.eviction == TranspositionTable.LRU:
+                self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                if self.eviction == TranspositionTable.LRU:
+                    self.entries.move_to_end(key)
+            elif len(self.entries) >= self.max_size:
+                self.entries.popitem(last=False)
+            self.entries[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -12,6 +12,7 @@ import time
 import argparse
 import datetime
 import shutil
+from ludo import LudoCodec
 # from model import nn_model
 
 """ This file contains stuff related to a version of the train server which stores logs that need to be evaluated using Elo rating"""
@@ -51,16 +52,16 @@ class TrainingService(rpyc.Service):
         print("Actor Disconnected")
 
     @rpyc.exposed
-    def push_game_data(self, data_store, log, player_to_elo):
-        """This method is used to push its recent game data which consists of logging data and
-        game states for experience store """
+    def push_game_data(self, game, player_to_elo):
+        """This method is used to push its recent game which is encoded as a single binary record by LudoCodec.encode_game(). The record is stored
+        in the logs of the player to evaluate"""
         # os.makedirs(TRAIN_DIRECTORY / "experience_store", exist_ok=True)
         os.makedirs(TRAIN_DIRECTORY / "logs_to_elo" / player_to_elo, exist_ok=True)
         time = datetime.datetime.now()
 
         # Storing game data in Experience Store
-        # with open(TRAIN_DIRECTORY / "experience_store" / (time.strftime("%Y_%b_%d_%H_%M_%S_%f")+".json"), "w", encoding="utf-8") as f:
-        #     f.write(str(data_store))
+        # with open(TRAIN_DIRECTORY / "experience_store" / (time.strftime("%Y_%b_%d_%H_%M_%S_%f")+".bin"), "wb") as f:
+        #     f.write(game)
         #
         # # Deleting older game files
         # games = os.listdir(TRAIN_DIRECTORY / "experience_store")
@@ -75,8 +76,8 @@ class TrainingService(rpyc.Service):
         #             pass
 
         # Storing logs
-        with open(TRAIN_DIRECTORY / "logs_to_elo" / player_to_elo / (time.strftime("%Y_%b_%d_%H_%M_%S_%f")+".json"), "w", encoding="utf-8") as f:
-            f.write(str(log))
+        with open(TRAIN_DIRECTORY / "logs_to_elo" / player_to_elo / (time.strftime("%Y_%b_%d_%H_%M_%S_%f")+".bin"), "wb") as f:
+            f.write(game)
 
 
 
@@ -138,6 +139,10 @@ class TrainingService(rpyc.Service):
         for p in path_list:
             path = path / p
 
+        # Binary logs are converted to the json log format of the visualizer
+        if path.suffix == ".bin":
+            with open(path, mode="rb") as f:
+                return json.dumps(LudoCodec.game_to_log(f.read()))
         with open(path, mode="r", encoding="utf-8") as f:
             s = f.read()
         return s
@@ -0,0 +1,104 @@
+import numpy as np
+from ludo_compact import CompactLudoModel, STATE_SIZE, CURRENT_PLAYER, GAME_OVER, DICE_ROLL
+
+""" This file contains a vectorized Ludo environment which plays many games in lockstep on stacked compact states """
+
+
+class VecLudo:
+    """ This class holds num_games games of the same GameConfig as rows of one (num_games, STATE_SIZE) uint8 array of compact states (see ludo_compact.py)
+    and steps all of them together. It follows the same flow as the Ludo class: a dice roll is generated after every move and a finished game is reset
+    automatically by step().
+        Attributes:
+            - model: CompactLudoModel used for the game calculations
+            - states: (num_games, STATE_SIZE) array of the current compact states
+            - winners: Index of the winner of every game in progress, -1 if nobody has finished yet
+        Methods:
+            - reset(indices=None): Resets the given games (all games by default) and generates their dice rolls
+            - roll(indices=None): Generates new dice rolls for the given games (all games by default)
+            - legal_moves(): Returns the list of moves of the current dice roll of every game. The moves are in the same format as in Ludo.
+            - step(actions): Takes a move in every game. actions[i] is an index into legal_moves()[i] and is ignored if game i has no move (a pass move [[]]
+                        is taken). Returns (dones, winners) arrays: dones[i] tells whether game i finished in this step and winners[i] is its winner
+                        (-1 if not finished). Finished games are reset.
+            - to_repr(out=None): Returns the (num_games, 59, 21) tensor representation of all games
+            - candidates_repr(out=None): Returns the tensor representation of the next states of all legal moves of all games in a single batch along with the
+                        index of the game of every row. The current player plane is set to the player who takes the move, as done by the greedy agents.
+    """
+
+    def __init__(self, config, num_games, seed=None):
+        self.config = config
+        self.model = CompactLudoModel(config)
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.initial_state = np.frombuffer(bytes(self.model.new_state()), dtype=np.uint8)
+        self.states = np.zeros(shape=(num_games, STATE_SIZE), dtype=np.uint8)
+        self.winners = np.full(num_games, -1, dtype=np.int64)
+        self.moves = [None] * num_games
+        self.reset()
+
+    def reset(self, indices=None):
+        indices = np.arange(self.num_games) if indices is None else np.asarray(indices, dtype=np.int64)
+        self.states[indices] = self.initial_state
+        self.winners[indices] = -1
+        self.roll(indices)
+        return self.states
+
+    def roll(self, indices=None):
+        indices = np.arange(self.num_games) if indices is None else np.asarray(indices, dtype=np.int64)
+        # Same as LudoModel.generate_dice_roll: up to three throws, stopping at the first throw which is not a 6
+        throws = self.rng.integers(1, 7, size=(len(indices), 3), dtype=np.uint8)
+        sixes = np.cumprod(throws == 6, axis=1, dtype=np.uint8)
+        throws[:, 1:] *= sixes[:, :2]
+        self.states[indices, DICE_ROLL: DICE_ROLL + 3] = throws
+        for i in indices:
+            self.moves[i] = None
+        return throws
+
+    def legal_moves(self):
+        for i in range(self.num_games):
+            if self.moves[i] is None:
+                state = bytearray(self.states[i].tobytes())
+                self.moves[i] = self.model.possible_moves(state, self.model.get_dice_roll(state))
+        return self.moves
+
+    def step(self, actions):
+        moves = self.legal_moves()
+        for i in range(self.num_games):
+            move = moves[i][actions[i]] if moves[i] else [[]]
+            next_state = self.model.generate_next_state(bytearray(self.states[i].tobytes()), move)
+            self.states[i] = np.frombuffer(bytes(next_state), dtype=np.uint8)
+            # The first player who gets all pawns to the finale is the winner
+            if self.winners[i] < 0:
+                for player_idx in range(len(self.config.players)):
+                    if self.model.all_pawns_in_finale(next_state, player_idx):
+                        self.winners[i] = player_idx
+                        break
+
+        dones = self.states[:, GAME_OVER] == 1
+        # If the game has ended but there are no winners declared yet, the current player is the winner since the other players have no moves left
+        no_winner = dones & (self.winners < 0)
+        self.winners[no_winner] = self.states[no_winner, CURRENT_PLAYER]
+        winners = np.where(dones, self.winners, -1)
+
+        finished = np.flatnonzero(dones)
+        running = np.flatnonzero(~dones)
+        if len(finished) > 0:
+            self.reset(finished)
+        self.roll(running)
+        return dones, winners
+
+    def to_repr(self, out=None):
+        return self.model.stacked_to_repr(self.states, out)
+
+    def candidates_repr(self, out=None):
+        moves = self.legal_moves()
+        game_index = []
+        next_states = []
+        for i in range(self.num_games):
+            state = bytearray(self.states[i].tobytes())
+            for move in moves[i]:
+                next_states.append(self.model.generate_next_state(state, move))
+                game_index.append(i)
+        game_index = np.array(game_index, dtype=np.int64)
+        representation = self.model.states_to_repr_batch(next_states, out)
+        representation[:, :, 20] = self.states[game_index, CURRENT_PLAYER, None] + 1
+        return representation, game_index
@@ -124,20 +124,19 @@ class AIAgent(Agent):
         # return [[]] # This is the signature for pass move
 
         start = time.perf_counter()
-        available_moves = []
-        for m in self.game_engine.model.all_possible_moves(state):
-            if m["roll"] == state["dice_roll"]:
-                available_moves = m["moves"]
+        # Moves with symmetric next states are evaluated once, a representative move stands for multiplicities[i] moves
+        available_moves, multiplicities = self.game_engine.model.distinct_moves(state, state["dice_roll"])
         if len(available_moves) > 0:
             next_states = []
             for move in available_moves:
                 next_states.append(self.game_engine.model.generate_next_state(state, move))
-            for s in next_states:
-                s["current_player"] = self.player_index
-            next_states = tf.stack([self.game_engine.model.state_to_repr(s) for s in next_states])
+            next_states = self.game_engine.model.states_to_repr_batch(next_states)
+            next_states[:, :, 20] = self.player_index + 1
+            next_states = tf.convert_to_tensor(next_states)
 
             results = self.nnet(next_states, training=False)[:, 0]
-            p = softmax(results, temp=0)
+            p = softmax(results, temp=0) * multiplicities
+            p = p / np.sum(p)
             # print(f"{self.player_index} {results} \n {p}")
             chosen_move = random.choices(available_moves, p)[0]
 
@@ -195,12 +194,12 @@ def create_new_game():
         # Initializing stores
         data_store = {
             "player_won": None,  # Initialize as None until a player wins
-            "states": [],  # List of game state tensors
+            "states": [],  # List of game states
         }
 
         log = {
             "config": None,  # Game configuration dictionary
-            "game": [],  # List of dictionaries for each game
+            "game": [],  # List of dictionaries of the move taken from every state
             "player_won": None  # Initialize as None until a player wins
         }
 
@@ -231,12 +230,9 @@ def get_state_jsonable_dict():
     new_state["last_move_id"] = ludo.state["last_move_id"]
     new_state["num_more_moves"] = ludo.state["num_more_moves"]
     new_state["blocks"] = []
-    new_state["moves"] = []
     for block in ludo.state["all_blocks"]:
         new_state["blocks"].append({"pawn_ids": [pawn.id for pawn in block.pawns], "rigid": block.rigid})
-    for roll in ludo.all_current_moves:
-        if roll["roll"] == ludo.state["dice_roll"]:
-            new_state["moves"] = roll["moves"]
+    new_state["moves"] = ludo.all_current_moves.moves(ludo.state["dice_roll"])
     return new_state
 
 
@@ -270,14 +266,20 @@ def get_state():
     return jsonify(new_state), 200
 
 
-def take_move_inner(move, move_id, top_moves):
+def take_move_inner(move, move_id, top_moves, check_legal=False):
+    """Takes the move if move_id is the next move id (stale and duplicate moves are ignored). With check_legal, the move is first checked against
+    the moves of the current roll. Returns False if the move was rejected as illegal."""
+    legal = True
     move_lock.acquire()
     move_event.clear()
     # print(f"Move_id: {move_id} received, state: {ludo.state} Move: {move}")
     if move_id == ludo.state["last_move_id"] + 1:
+        # The move of a human is checked against the moves of the current roll, the enumeration stops at the first match
+        legal = not check_legal or ludo.model.is_legal_move(ludo.state, ludo.state["dice_roll"], move)
+    if move_id == ludo.state["last_move_id"] + 1 and legal:
         global data_store, log
-        game_data = {"game_state": ludo.model.get_state_jsonable(ludo.state)}
-        data_store["states"].append(ludo.model.state_to_repr(ludo.state).tolist())
+        game_data = {}
+        data_store["states"].append(ludo.state)
 
         ludo.turn(move, move_id)
         # print(f"After taking turn, state: {ludo.state}")
@@ -289,27 +291,29 @@ def take_move_inner(move, move_id, top_moves):
 
         # If game is over, send the data to train_server
         if ludo.state["game_over"]:
-            game_data = {"game_state": ludo.model.get_state_jsonable(ludo.state), "move_id": len(log["game"]),
-                         "move": []}
-            log["game"].append(game_data)
-            data_store["states"].append(ludo.model.state_to_repr(ludo.state).tolist())
+            data_store["states"].append(ludo.state)
             data_store["player_won"] = ludo.model.config.players.index(ludo.winner) + 1
             log["config"] = ludo.model.config.get_dict()
             log["player_won"] = data_store["player_won"]
             train_server_conn = rpyc.connect(TRAIN_SERVER_IP, TRAIN_SERVER_PORT, config={"sync_request_timeout": None})
-            train_server_conn.root.push_game_data(json.dumps(data_store), json.dumps(log))
+            # The whole game is sent as a single binary record (see LudoCodec)
+            game = ludo.model.codec.encode_game(data_store["states"], [game_data["move"] for game_data in log["game"]],
+                                                data_store["player_won"] - 1, [game_data["top_moves"] for game_data in log["game"]])
+            train_server_conn.root.push_game_data(game)
             train_server_conn.close()
         else:
             # If game is not over, switch to the next player
             threading.Thread(target=players[ludo.state["current_player"]].take_next_move, args=(ludo.state,)).start()
     move_lock.release()
     move_event.set()
+    return legal
 
 
 @app.route("/take_move", methods=["POST"])
 def take_move():
     move = request.get_json()
-    take_move_inner(move["move"], move["move_id"], move["top_moves"])
+    if not take_move_inner(move["move"], move["move_id"], move["top_moves"], check_legal=True):
+        return "Illegal move", 400
     new_state = get_state_jsonable_dict()
     return jsonify(new_state), 200
 